@@ -1,13 +1,26 @@
+import logging
 import os
+from dotenv import load_dotenv
+
+# Green-thread servers must patch the standard library before anything else
+# (Flask, requests, SDK clients) imports socket/threading
+load_dotenv()
+if os.getenv('SOCKETIO_ASYNC_MODE') == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
 from app import create_app
 from app.config import config
 
+# Configure logging once for the whole process
+logging.basicConfig(level=logging.INFO)
+
 if __name__ == '__main__':
     # Get configuration name from environment
     config_name = os.getenv('FLASK_ENV', 'default')
     
     # Create the Flask app and SocketIO using the factory pattern
-    app, socketio = create_app(config_name)
+    app, socketio = create_app(config_name, use_realtime=False)
     
     # Get configuration object
     app_config = config[config_name]
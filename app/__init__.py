@@ -3,25 +3,70 @@ from flask_socketio import SocketIO
 from flask_sock import Sock
 import os
 from app.config import config
+from app.json_provider import OrjsonProvider
 
-def create_app(config_name=None):
-    """Application factory pattern"""
+def _register_realtime_routes(app, sock):
+    """Real-time Google Speech routes"""
+    from app.routes.real_time_api_routes import api_bp, setup_websocket_routes, WELCOME_TEXT, GOODBYE_TEXT
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+    
+    # Setup WebSocket routes for real-time streaming
+    setup_websocket_routes(sock)
+    
+    print("✅ Using Google Speech-to-Text with Real-time Streaming")
+    return (WELCOME_TEXT, GOODBYE_TEXT)
+
+def _register_legacy_routes(app, sock):
+    """Original Whisper-based routes"""
+    from app.routes.api_routes import api_bp, setup_websocket_routes, WELCOME_TEXT, GOODBYE_TEXT
+    app.register_blueprint(api_bp, url_prefix='')
+    
+    # Setup WebSocket routes
+    setup_websocket_routes(sock)
+    
+    print("⚠️  Using legacy OpenAI Whisper (batch processing)")
+    return (WELCOME_TEXT, GOODBYE_TEXT)
+
+# Route set registered for each mode; only the chosen routes module is imported.
+# Each returns the fixed phrases its calls speak, for the TTS warmup
+_ROUTE_REGISTRARS = {
+    'google': _register_realtime_routes,
+    'whisper': _register_legacy_routes
+}
+
+def create_app(config_name=None, use_realtime=None):
+    """
+    Application factory pattern
+    
+    Args:
+        config_name (str): Configuration name, defaults to FLASK_ENV
+        use_realtime (bool): Force real-time (True) or legacy (False) routes;
+            None follows the USE_GOOGLE_SPEECH setting
+    """
     if config_name is None:
         config_name = os.getenv('FLASK_ENV', 'default')
     
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.json = OrjsonProvider(app)
     
     # Initialize SocketIO and Sock
-    socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+    socketio = SocketIO(app, cors_allowed_origins="*", async_mode=app.config['SOCKETIO_ASYNC_MODE'])
     sock = Sock(app)
     
-    # Register blueprints
-    from app.routes.api_routes import api_bp, setup_websocket_handlers, setup_websocket_routes
-    app.register_blueprint(api_bp, url_prefix='')
+    # Choose which routes to use based on configuration
+    if use_realtime is None:
+        use_realtime = app.config['USE_GOOGLE_SPEECH']
+    mode = 'google' if use_realtime and app.config['USE_GOOGLE_SPEECH'] else 'whisper'
+    fixed_phrases = _ROUTE_REGISTRARS[mode](app, sock)
     
-    # Setup WebSocket handlers
-    setup_websocket_handlers(socketio)
-    setup_websocket_routes(sock)
+    # Expire idle in-memory sessions without blocking request handling
+    from app.middleware.request_handler import session_middleware
+    socketio.start_background_task(session_middleware.run_cleanup_loop, socketio.sleep)
+    
+    # Open Gemini/ElevenLabs connections and cache fixed phrases off the request path
+    if app.config['WARMUP_SERVICES']:
+        from app.services.warmup import warmup_services
+        socketio.start_background_task(warmup_services, fixed_phrases)
     
     return app, socketio
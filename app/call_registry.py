@@ -0,0 +1,94 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+@dataclass(slots=True)
+class CallState:
+    """State of one live call, from the voice webhook until the stream stops"""
+    call_sid: str
+    phone_number: Optional[str]
+    # time.monotonic() when the call started; only for measuring durations
+    started: float = field(default_factory=time.monotonic)
+    stream_sid: Optional[str] = None
+    websocket: Any = None
+    connected: bool = False
+    # Inbound µ-law waiting to be processed: a bytearray batch for the
+    # streaming recognizer, or an AudioRing for the legacy batch flush
+    audio_buffer: Any = field(default_factory=bytearray)
+    streaming_session: Any = None
+    # Held while a turn for this call is being answered
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # A flush of the audio buffer is queued or running
+    flush_scheduled: bool = False
+    session_data: Optional[Dict[str, Any]] = None
+
+class ConversationRegistry:
+    """
+    Live calls indexed by call SID and by media stream SID
+    
+    Writes (calls starting, streams attaching, calls ending) happen a few
+    times per call and take the lock so both indexes change together.
+    Lookups run on every media frame and rely on dict.get being atomic.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[str, CallState] = {}
+        self._streams: Dict[str, str] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._calls)
+    
+    def __contains__(self, call_sid) -> bool:
+        return call_sid in self._calls
+    
+    def add(self, state: CallState):
+        """Register a call, replacing any previous state for its SID"""
+        with self._lock:
+            previous = self._calls.get(state.call_sid)
+            if previous is not None and previous.stream_sid:
+                self._streams.pop(previous.stream_sid, None)
+            self._calls[state.call_sid] = state
+    
+    def get(self, call_sid: str) -> Optional[CallState]:
+        return self._calls.get(call_sid)
+    
+    def get_by_stream(self, stream_sid: str) -> Optional[CallState]:
+        call_sid = self._streams.get(stream_sid)
+        return self._calls.get(call_sid) if call_sid else None
+    
+    def attach_stream(self, call_sid: str, stream_sid: str, websocket) -> Optional[CallState]:
+        """
+        Bind a call to its media stream once Twilio sends the start event
+        
+        Returns:
+            Optional[CallState]: The call, or None if it is not registered
+        """
+        with self._lock:
+            state = self._calls.get(call_sid)
+            if state is None:
+                return None
+            
+            state.stream_sid = stream_sid
+            state.websocket = websocket
+            state.connected = True
+            self._streams[stream_sid] = call_sid
+            return state
+    
+    def remove_by_stream(self, stream_sid: str) -> Optional[CallState]:
+        """Unregister the call bound to a stream; returns the removed state"""
+        with self._lock:
+            call_sid = self._streams.pop(stream_sid, None)
+            return self._calls.pop(call_sid, None) if call_sid else None
+    
+    def remove(self, call_sid: str) -> Optional[CallState]:
+        """Unregister a call and its stream; returns the removed state"""
+        with self._lock:
+            state = self._calls.pop(call_sid, None)
+            if state is not None and state.stream_sid:
+                self._streams.pop(state.stream_sid, None)
+            return state
+    
+    def streaming_session_count(self) -> int:
+        return sum(1 for state in list(self._calls.values()) if state.streaming_session is not None)
@@ -12,20 +12,43 @@ class Config:
     FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
     FLASK_BASE_URL = os.getenv('FLASK_BASE_URL', 'https://your-ngrok-url.ngrok.io')
     
+    # SocketIO async mode: 'threading', 'eventlet' or 'gevent'
+    # eventlet/gevent require the entry point to monkey-patch before other imports
+    # (wsgi.py defaults to gevent for gunicorn)
+    SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+    
     # Eleven Labs Configuration
     ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
     ELEVENLABS_VOICE_ID = os.getenv('ELEVENLABS_VOICE_ID', 'pNInz6obpgDQGcFmaJgB')  # Default Arabic voice
     
+    # Directory for synthesized phrases kept across restarts and shared by
+    # workers (disabled when unset); oldest files are evicted past the limit
+    TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR')
+    TTS_DISK_CACHE_SIZE = int(os.getenv('TTS_DISK_CACHE_SIZE', 1000))
+    
     # Gemini AI Configuration
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     
+    # Reuse replies to opening utterances that mean the same as a cached one
+    # (costs an embedding request per uncached opening)
+    SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.9))
+    
     # Google Cloud Speech-to-Text Configuration
     GOOGLE_APPLICATION_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')  # Path to service account JSON
     GOOGLE_PROJECT_ID = os.getenv('GOOGLE_PROJECT_ID')
+    USE_GOOGLE_SPEECH = os.getenv('USE_GOOGLE_SPEECH', 'true').lower() == 'true'  # Real-time routes vs legacy Whisper routes
     
     # OpenAI Configuration (for Whisper) - Deprecated, keeping for backward compatibility
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     
+    # Warm backend connections and the TTS cache in the background at startup
+    WARMUP_SERVICES = os.getenv('WARMUP_SERVICES', 'true').lower() == 'true'
+    
+    # Session storage - set REDIS_URL to share call sessions across workers
+    REDIS_URL = os.getenv('REDIS_URL')
+    SESSION_TTL_SECONDS = int(os.getenv('SESSION_TTL_SECONDS', 86400))
+    
     # Twilio Configuration
     TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
@@ -1,15 +1,37 @@
 from flask import request, session
 from functools import wraps
 import logging
-from typing import Dict, Any, Optional
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Tuple, Callable
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from app.config import Config
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class TwilioMiddleware:
     """Middleware for handling Twilio-specific request processing"""
     
+    # (output key, Twilio form field) pairs used by extract_twilio_data
+    TWILIO_FIELDS = (
+        ('call_sid', 'CallSid'),
+        ('account_sid', 'AccountSid'),
+        ('from_number', 'From'),
+        ('to_number', 'To'),
+        ('call_status', 'CallStatus'),
+        ('direction', 'Direction'),
+        ('speech_result', 'SpeechResult'),
+        ('confidence', 'Confidence'),
+        ('recording_url', 'RecordingUrl'),
+        ('digits', 'Digits'),
+        ('caller_city', 'CallerCity'),
+        ('caller_state', 'CallerState'),
+        ('caller_country', 'CallerCountry')
+    )
+    
     @staticmethod
     def validate_twilio_request(f):
         """
@@ -19,8 +41,8 @@ class TwilioMiddleware:
         @wraps(f)
         def decorated_function(*args, **kwargs):
             # Log incoming request
-            logger.info(f"Received Twilio request: {request.method} {request.url}")
-            logger.info(f"Form data: {dict(request.form)}")
+            logger.info("Received Twilio request: %s %s", request.method, request.url)
+            logger.debug("Form data: %s", request.form)
             
             # Basic validation
             if request.method not in ['POST', 'GET']:
@@ -47,28 +69,93 @@ class TwilioMiddleware:
         Returns:
             Dict containing extracted Twilio data
         """
-        return {
-            'call_sid': request_obj.form.get('CallSid'),
-            'account_sid': request_obj.form.get('AccountSid'),
-            'from_number': request_obj.form.get('From'),
-            'to_number': request_obj.form.get('To'),
-            'call_status': request_obj.form.get('CallStatus'),
-            'direction': request_obj.form.get('Direction'),
-            'speech_result': request_obj.form.get('SpeechResult'),
-            'confidence': request_obj.form.get('Confidence'),
-            'recording_url': request_obj.form.get('RecordingUrl'),
-            'digits': request_obj.form.get('Digits'),
-            'caller_city': request_obj.form.get('CallerCity'),
-            'caller_state': request_obj.form.get('CallerState'),
-            'caller_country': request_obj.form.get('CallerCountry')
-        }
+        get = request_obj.form.get
+        return {key: get(field) for key, field in TwilioMiddleware.TWILIO_FIELDS}
 
 class SessionMiddleware:
     """Middleware for managing conversation sessions"""
     
-    def __init__(self):
-        # In production, use Redis or database for session storage
+    # Minimum seconds between background Redis writes for one caller;
+    # updates arriving in between are merged into the next write
+    WRITE_INTERVAL_SECONDS = 2.0
+    
+    def __init__(self, redis_url: Optional[str] = None, ttl_seconds: int = 86400):
+        """
+        Args:
+            redis_url (str): Redis connection URL; sessions stay in process memory when unset
+            ttl_seconds (int): Idle time after which a Redis session expires
+        """
+        self.ttl_seconds = ttl_seconds
+        self.redis = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        
+        # Write-behind state for background updates: merged data waiting to be
+        # written, and the monotonic time of each caller's last write
+        self._pending_writes: Dict[str, Dict[str, Any]] = {}
+        self._last_write: Dict[str, float] = {}
+        self._next_sweep = 0.0  # monotonic time of the next _last_write eviction
+        self._pending_lock = threading.Lock()
+        
+        # Process-local storage, used when Redis is not configured
         self.sessions: Dict[str, Dict[str, Any]] = {}
+        
+        # Min-heap of (last_activity, phone_number); stale entries are
+        # skipped when popped and compacted away in bulk, instead of being
+        # removed on every update
+        self._activity_heap: List[Tuple[datetime, str]] = []
+        self._heap_lock = threading.Lock()
+        
+        if redis_url:
+            import redis
+            
+            # from_url keeps a connection pool shared by all request threads
+            self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+            logger.info("Session storage: Redis")
+    
+    @staticmethod
+    def _new_session() -> Dict[str, Any]:
+        """Default data for a caller without a session"""
+        return {
+            'conversation_count': 0,
+            'last_activity': None,
+            'language_preference': 'arabic',
+            'voice_preference': 'female',
+            'context': {}
+        }
+    
+    @staticmethod
+    def _redis_key(phone_number: str) -> str:
+        return f"session:{phone_number}"
+    
+    def _store_redis(self, phone_number: str, data: Dict[str, Any]):
+        """Write session fields and refresh the expiry in one round trip"""
+        key = self._redis_key(phone_number)
+        mapping = {field: orjson.dumps(value, default=str) for field, value in data.items()}
+        
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+    
+    def _track_activity(self, phone_number: str, data: Dict[str, Any]):
+        """Queue the session for expiry when its last_activity changes"""
+        last_activity = data.get('last_activity')
+        if last_activity is None:
+            return
+        
+        with self._heap_lock:
+            heap = self._activity_heap
+            heapq.heappush(heap, (last_activity, phone_number))
+            
+            # Every update leaves the caller's previous entry behind; drop
+            # them once they outnumber the live sessions
+            if len(heap) > 2 * len(self.sessions) + 64:
+                sessions = self.sessions
+                heap[:] = [
+                    (activity, number) for activity, number in heap
+                    if number in sessions and sessions[number].get('last_activity') == activity
+                ]
+                heapq.heapify(heap)
     
     def get_session(self, phone_number: str) -> Dict[str, Any]:
         """
@@ -80,14 +167,17 @@ class SessionMiddleware:
         Returns:
             Dict containing session data
         """
+        if self.redis is not None:
+            stored = self.redis.hgetall(self._redis_key(phone_number))
+            if stored:
+                return {field: orjson.loads(value) for field, value in stored.items()}
+            
+            session_data = self._new_session()
+            self._store_redis(phone_number, session_data)
+            return session_data
+        
         if phone_number not in self.sessions:
-            self.sessions[phone_number] = {
-                'conversation_count': 0,
-                'last_activity': None,
-                'language_preference': 'arabic',
-                'voice_preference': 'female',
-                'context': {}
-            }
+            self.sessions[phone_number] = self._new_session()
         
         return self.sessions[phone_number]
     
@@ -99,10 +189,77 @@ class SessionMiddleware:
             phone_number (str): User's phone number
             data (Dict): Data to update
         """
+        if self.redis is not None:
+            self._store_redis(phone_number, data)
+            return
+        
         if phone_number in self.sessions:
             self.sessions[phone_number].update(data)
         else:
             self.sessions[phone_number] = data
+        self._track_activity(phone_number, data)
+    
+    def update_session_in_background(self, phone_number: str, data: Dict[str, Any]):
+        """
+        Update session data without blocking the caller on storage I/O
+        
+        Lets per-turn bookkeeping overlap with sending the AI response
+        instead of sitting on the call's critical path. Redis writes for a
+        caller are coalesced to at most one per WRITE_INTERVAL_SECONDS.
+        
+        Args:
+            phone_number (str): User's phone number
+            data (Dict): Data to update
+        """
+        if self.redis is None:
+            # In-process updates are a dict merge; no reason to hop threads
+            self.get_session(phone_number).update(data)
+            self._track_activity(phone_number, data)
+            return
+        
+        with self._pending_lock:
+            pending = self._pending_writes.get(phone_number)
+            if pending is not None:
+                # A write is already scheduled; it will carry this update too
+                pending.update(data)
+                return
+            
+            self._pending_writes[phone_number] = dict(data)
+            last_write = self._last_write.get(phone_number)
+            delay = 0.0 if last_write is None else last_write + self.WRITE_INTERVAL_SECONDS - time.monotonic()
+        
+        if delay > 0:
+            timer = threading.Timer(delay, self._flush_pending_write, args=(phone_number,))
+            timer.daemon = True
+            timer.start()
+            return
+        
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=4, thread_name_prefix='session-writer')
+        self._writer.submit(self._flush_pending_write, phone_number)
+    
+    def _flush_pending_write(self, phone_number: str):
+        """Write a caller's merged pending update; runs off the request path"""
+        now = time.monotonic()
+        with self._pending_lock:
+            data = self._pending_writes.pop(phone_number, None)
+            self._last_write[phone_number] = now
+            
+            # Writes older than the interval no longer delay anything; drop
+            # them (at most once per interval) so callers are not kept forever
+            if now >= self._next_sweep:
+                cutoff = now - self.WRITE_INTERVAL_SECONDS
+                self._last_write = {number: written for number, written in self._last_write.items()
+                                    if written > cutoff}
+                self._next_sweep = now + self.WRITE_INTERVAL_SECONDS
+        
+        if not data:
+            return
+        
+        try:
+            self._store_redis(phone_number, data)
+        except Exception as e:
+            logger.error(f"Failed to update session for {phone_number}: {str(e)}")
     
     def clear_session(self, phone_number: str):
         """
@@ -111,30 +268,80 @@ class SessionMiddleware:
         Args:
             phone_number (str): User's phone number
         """
+        if self.redis is not None:
+            with self._pending_lock:
+                self._pending_writes.pop(phone_number, None)
+                self._last_write.pop(phone_number, None)
+            self.redis.delete(self._redis_key(phone_number))
+            return
+        
         if phone_number in self.sessions:
             del self.sessions[phone_number]
     
-    def cleanup_old_sessions(self, max_age_hours: int = 24):
+    def cleanup_old_sessions(self, max_age_hours: int = 24) -> Optional[float]:
         """
         Clean up old sessions
         
+        Redis sessions expire on their own, so this only sweeps the
+        in-process store. Only heap entries that are already past the
+        cutoff are visited.
+        
         Args:
             max_age_hours (int): Maximum age of sessions in hours
+            
+        Returns:
+            Optional[float]: Seconds until the next session is due to expire,
+            or None when nothing is pending
         """
-        from datetime import datetime, timedelta
+        if self.redis is not None:
+            return None
         
-        cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
+        max_age = timedelta(hours=max_age_hours)
+        cutoff_time = datetime.now() - max_age
+        expired_count = 0
         
-        expired_sessions = []
-        for phone_number, session_data in self.sessions.items():
-            last_activity = session_data.get('last_activity')
-            if last_activity and last_activity < cutoff_time:
-                expired_sessions.append(phone_number)
+        with self._heap_lock:
+            heap = self._activity_heap
+            while heap and heap[0][0] < cutoff_time:
+                last_activity, phone_number = heapq.heappop(heap)
+                
+                # Skip entries superseded by newer activity or a cleared session
+                session_data = self.sessions.get(phone_number)
+                if session_data is None or session_data.get('last_activity') != last_activity:
+                    continue
+                
+                del self.sessions[phone_number]
+                expired_count += 1
+            
+            next_expiry = heap[0][0] + max_age if heap else None
         
-        for phone_number in expired_sessions:
-            del self.sessions[phone_number]
+        if expired_count:
+            logger.info(f"Cleaned up {expired_count} expired sessions")
         
-        logger.info(f"Cleaned up {len(expired_sessions)} expired sessions")
+        if next_expiry is None:
+            return None
+        return max((next_expiry - datetime.now()).total_seconds(), 0.0)
+    
+    def run_cleanup_loop(self, sleep: Callable[[float], Any], max_age_hours: int = 24,
+                         max_interval_seconds: float = 300):
+        """
+        Expire sessions forever, waking at the next expiry
+        
+        Args:
+            sleep (Callable): Sleep function of the async mode in use (socketio.sleep)
+            max_age_hours (int): Maximum age of sessions in hours
+            max_interval_seconds (float): Longest time to sleep between sweeps
+        """
+        while True:
+            try:
+                next_expiry = self.cleanup_old_sessions(max_age_hours)
+            except Exception as e:
+                logger.error(f"Error cleaning up sessions: {str(e)}")
+                next_expiry = None
+            
+            if next_expiry is None:
+                next_expiry = max_interval_seconds
+            sleep(min(next_expiry, max_interval_seconds))
 
 class RequestLogger:
     """Middleware for logging requests and responses"""
@@ -144,18 +351,19 @@ class RequestLogger:
         """Decorator to log incoming requests"""
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            logger.info(f"Request: {request.method} {request.path}")
-            logger.info(f"Headers: {dict(request.headers)}")
-            logger.info(f"Form data: {dict(request.form)}")
+            logger.info("Request: %s %s", request.method, request.path)
+            # Arguments are only formatted when a DEBUG handler consumes them
+            logger.debug("Headers: %s", request.headers)
+            logger.debug("Form data: %s", request.form)
             
             result = f(*args, **kwargs)
             
-            logger.info(f"Response status: {getattr(result, 'status_code', 'Unknown')}")
+            logger.info("Response status: %s", getattr(result, 'status_code', 'Unknown'))
             
             return result
         return decorated_function
 
 # Global instances
-session_middleware = SessionMiddleware()
+session_middleware = SessionMiddleware(Config.REDIS_URL, Config.SESSION_TTL_SECONDS)
 twilio_middleware = TwilioMiddleware()
 request_logger = RequestLogger()
@@ -1,9 +1,8 @@
-from flask import Blueprint, jsonify, request, Response
-from flask_socketio import SocketIO, emit
+from flask import Blueprint, request, Response
 from flask_sock import Sock
-from app.services.twilio_service import twilio_service
-from app.services.speech_service import speech_service
-from app.services.conversation_service import conversation_service
+from app.twilio_frames import decode_frame, media_message_parts
+from app.services.audio_utils import AudioRing, is_silence, ulaw_to_pcm16
+from app.call_registry import CallState, ConversationRegistry
 from app.middleware.request_handler import (
     twilio_middleware, 
     session_middleware, 
@@ -11,48 +10,80 @@ from app.middleware.request_handler import (
 )
 from datetime import datetime
 import logging
-import json
-import base64
+import orjson
+import msgspec
+from binascii import a2b_base64, b2a_base64
+import hashlib
 import asyncio
-from threading import Thread
+import queue
+from app.services.event_loop import BoundedExecutor, call_later
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # WebSocket URL configuration
 WEBSOCKET_URL = "wss://a0da8bdf9611.ngrok-free.app/ws"
 
+# TwiML connecting every incoming call to the media stream; WEBSOCKET_URL
+# is fixed, so the document is rendered and encoded once
+STREAM_TWIML = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    f'<Response><Connect><Stream url="{WEBSOCKET_URL}" /></Connect></Response>'
+).encode('utf-8')
+
+# Fixed phrases; their audio is synthesized once and replayed
+WELCOME_TEXT = "أهلاً وسهلاً! أنا مساعدك الذكي. كيف يمكنني مساعدتك اليوم؟"
+GOODBYE_TEXT = "شكراً لك! إلى اللقاء."
+
 # Create the blueprint
 api_bp = Blueprint('api', __name__)
 
-# Store active conversations
-active_conversations = {}
+# Active calls, by call SID and by the stream SID media frames carry
+conversations = ConversationRegistry()
+
+# Audio ring size per call: 8 seconds of 8kHz µ-law, enough to keep
+# buffering while a turn is being answered
+AUDIO_BUFFER_CAPACITY = 65536
+
+# Workers for turn processing (transcription, Gemini, TTS); bounded so a
+# burst of flushes cannot fan out into unbounded threads
+_AUDIO_EXECUTOR = BoundedExecutor(max_workers=16, max_pending=64, thread_name_prefix='audio')
+
+# Audio buffers returned by finished calls, reused by new ones
+_BUFFER_POOL = queue.SimpleQueue()
+_BUFFER_POOL_SIZE = 64
+
+# The home payload never changes, so serialize it once at import time
+_HOME_BODY = orjson.dumps({
+    "message": "Welcome to the AI Voice Assistant API!",
+    "status": "success",
+    "description": "Real-time voice conversation using Whisper AI, Gemini AI, and ElevenLabs",
+    "features": {
+        "speech_to_text": "OpenAI Whisper",
+        "ai_conversation": "Google Gemini",
+        "text_to_speech": "ElevenLabs (Arabic Syrian)",
+        "real_time": "WebSocket Streaming"
+    },
+    "endpoints": {
+        "/voice": "Initial call endpoint - starts WebSocket stream",
+        "/ws": "WebSocket endpoint for real-time audio streaming (Flask-Sock)"
+    },
+    "websocket_url": WEBSOCKET_URL,
+    "websocket_info": {
+        "protocol": "WebSocket (Flask-Sock)",
+        "purpose": "Twilio Media Stream connection",
+        "events": ["start", "media", "stop"]
+    }
+})
+_HOME_ETAG = hashlib.sha1(_HOME_BODY).hexdigest()
 
 @api_bp.route('/', methods=['GET'])
 def home():
     """Home route that returns a welcome message"""
-    return jsonify({
-        "message": "Welcome to the AI Voice Assistant API!",
-        "status": "success",
-        "description": "Real-time voice conversation using Whisper AI, Gemini AI, and ElevenLabs",
-        "features": {
-            "speech_to_text": "OpenAI Whisper",
-            "ai_conversation": "Google Gemini",
-            "text_to_speech": "ElevenLabs (Arabic Syrian)",
-            "real_time": "WebSocket Streaming"
-        },
-        "endpoints": {
-            "/voice": "Initial call endpoint - starts WebSocket stream",
-            "/ws": "WebSocket endpoint for real-time audio streaming (Flask-Sock)"
-        },
-        "websocket_url": WEBSOCKET_URL,
-        "websocket_info": {
-            "protocol": "WebSocket (Flask-Sock)",
-            "purpose": "Twilio Media Stream connection",
-            "events": ["start", "media", "stop"]
-        }
-    })
+    response = Response(_HOME_BODY, mimetype='application/json')
+    response.set_etag(_HOME_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
 
 @api_bp.route('/voice', methods=['POST'])
 @twilio_middleware.validate_twilio_request
@@ -81,29 +112,42 @@ def start_websocket_conversation():
         session_middleware.update_session(phone_number, session_data)
         
         # Store conversation context
-        active_conversations[call_sid] = {
-            'phone_number': phone_number,
-            'session_data': session_data,
-            'audio_buffer': b'',
-            'processing': False,
-            'connected': False
-        }
-        
-        # Create TwiML response that connects to WebSocket
-        twiml_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-  <Connect>
-    <Stream url="{WEBSOCKET_URL}" />
-  </Connect>
-</Response>"""
+        conversations.add(CallState(
+            call_sid=call_sid,
+            phone_number=phone_number,
+            session_data=session_data,
+            audio_buffer=acquire_buffer()
+        ))
         
-        return Response(twiml_response, mimetype='text/xml')
+        # TwiML response that connects to WebSocket
+        return Response(STREAM_TWIML, mimetype='text/xml')
         
     except Exception as e:
         logger.error(f"Error starting WebSocket conversation: {str(e)}")
+        from app.services.twilio_service import twilio_service
         error_response = twilio_service.create_error_response("عذراً، حدث خطأ في بدء المحادثة.")
         return Response(error_response, mimetype='text/xml')
 
+def acquire_buffer():
+    """Get an audio ring from the pool, or allocate one if it is empty"""
+    try:
+        return _BUFFER_POOL.get_nowait()
+    except queue.Empty:
+        return AudioRing(AUDIO_BUFFER_CAPACITY)
+
+def release_buffer(conversation):
+    """
+    Return a finished conversation's audio ring to the pool
+    
+    The ring is detached under the turn lock, after any running flush has
+    read it, so no flush can read audio from the call that reuses it.
+    """
+    with conversation.lock:
+        ring, conversation.audio_buffer = conversation.audio_buffer, None
+    if ring is not None and _BUFFER_POOL.qsize() < _BUFFER_POOL_SIZE:
+        ring.reset()
+        _BUFFER_POOL.put(ring)
+
 # WebSocket setup function for Flask-Sock
 def setup_websocket_routes(sock):
     """Setup WebSocket routes using Flask-Sock"""
@@ -113,25 +157,30 @@ def setup_websocket_routes(sock):
         """Handle Twilio WebSocket connection"""
         logger.info("Twilio WebSocket connection established")
         
+        # Bound once; this loop runs for every 20ms media frame
+        receive = ws.receive
+        decode = decode_frame
+        handlers = _EVENT_HANDLERS
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        
         try:
             while True:
-                message = ws.receive()
+                message = receive()
                 if message:
                     try:
-                        data = json.loads(message)
-                        event_type = data.get('event')
+                        data = decode(message)
+                        event_type = data.event
                         
-                        logger.info(f"Received Twilio WebSocket event: {event_type}")
+                        if debug_enabled:
+                            logger.debug("Received Twilio WebSocket event: %s", event_type)
                         
-                        if event_type == 'start':
-                            handle_twilio_stream_start(data, ws)
-                        elif event_type == 'media':
-                            handle_twilio_media_chunk(data, ws)
-                        elif event_type == 'stop':
-                            handle_twilio_stream_stop(data, ws)
+                        handler = handlers.get(event_type)
+                        if handler:
+                            handler(data, ws)
+                        if event_type == 'stop':
                             break
                             
-                    except json.JSONDecodeError as e:
+                    except msgspec.DecodeError as e:
                         logger.error(f"Failed to parse WebSocket message: {e}")
                     except Exception as e:
                         logger.error(f"Error processing WebSocket message: {e}")
@@ -144,25 +193,15 @@ def setup_websocket_routes(sock):
 def handle_twilio_stream_start(data, ws):
     """Handle Twilio stream start via direct WebSocket"""
     try:
-        start_data = data.get('start', {})
-        call_sid = start_data.get('callSid')
-        stream_sid = data.get('streamSid')
+        call_sid = data.start.callSid
+        stream_sid = data.streamSid
         
         logger.info(f"Twilio stream started - Call SID: {call_sid}, Stream SID: {stream_sid}")
         
-        if call_sid in active_conversations:
-            active_conversations[call_sid]['connected'] = True
-            active_conversations[call_sid]['stream_sid'] = stream_sid
-            active_conversations[call_sid]['websocket'] = ws
-            
+        if conversations.attach_stream(call_sid, stream_sid, ws) is not None:
             # Add a small delay before sending welcome message to ensure connection is stable
-            import time
-            def delayed_welcome():
-                time.sleep(0.5)  # Wait 500ms for connection to stabilize
-                welcome_text = "أهلاً وسهلاً! أنا مساعدك الذكي. كيف يمكنني مساعدتك اليوم؟"
-                send_twilio_ai_response(call_sid, welcome_text, stream_sid, ws)
-            
-            Thread(target=delayed_welcome).start()
+            call_later(0.5, _AUDIO_EXECUTOR, send_twilio_ai_response,
+                       call_sid, WELCOME_TEXT, stream_sid, ws, cache=True)
             
     except Exception as e:
         logger.error(f"Error handling Twilio stream start: {str(e)}")
@@ -170,26 +209,21 @@ def handle_twilio_stream_start(data, ws):
 def handle_twilio_media_chunk(data, ws):
     """Handle Twilio media chunk via direct WebSocket"""
     try:
-        media_payload = data.get('media', {})
-        audio_payload = media_payload.get('payload')
-        stream_sid = data.get('streamSid')
+        audio_payload = data.media.payload
+        stream_sid = data.streamSid
         
-        # Find call_sid from stream_sid
-        call_sid = None
-        for cid, conv in active_conversations.items():
-            if conv.get('stream_sid') == stream_sid:
-                call_sid = cid
-                break
-        
-        if call_sid and call_sid in active_conversations and audio_payload:
+        conversation = conversations.get_by_stream(stream_sid)
+        if conversation is not None and audio_payload:
             try:
-                audio_data = base64.b64decode(audio_payload)
-                active_conversations[call_sid]['audio_buffer'] += audio_data
+                audio_data = a2b_base64(audio_payload)  # Twilio payloads are clean base64
+                buffer_size = conversation.audio_buffer.write(audio_data)
                 
-                buffer_size = len(active_conversations[call_sid]['audio_buffer'])
-                # Process audio more frequently (1 second instead of 2)
-                if buffer_size > 8000:  # 1 second at 8kHz mono (µ-law is 1 byte per sample)
-                    Thread(target=process_twilio_audio_buffer, args=(call_sid, stream_sid, ws)).start()
+                # Process audio more frequently (1 second instead of 2); while a
+                # flush is queued or running the audio keeps buffering for the next one
+                if buffer_size > 8000 and not conversation.flush_scheduled:  # 1 second at 8kHz µ-law
+                    conversation.flush_scheduled = True
+                    if _AUDIO_EXECUTOR.try_submit(process_twilio_audio_buffer, conversation.call_sid, stream_sid, ws) is None:
+                        conversation.flush_scheduled = False
                     
             except Exception as e:
                 logger.error(f"Error processing Twilio audio chunk: {str(e)}")
@@ -200,97 +234,105 @@ def handle_twilio_media_chunk(data, ws):
 def handle_twilio_stream_stop(data, ws):
     """Handle Twilio stream stop via direct WebSocket"""
     try:
-        stream_sid = data.get('streamSid')
+        stream_sid = data.streamSid
         logger.info(f"Twilio stream stopped - Stream SID: {stream_sid}")
         
         # Find and clean up conversation
-        call_sid_to_remove = None
-        for call_sid, conv in active_conversations.items():
-            if conv.get('stream_sid') == stream_sid:
-                call_sid_to_remove = call_sid
-                break
-        
-        if call_sid_to_remove:
-            logger.info(f"Cleaning up Twilio conversation for call: {call_sid_to_remove}")
-            del active_conversations[call_sid_to_remove]
+        conversation = conversations.remove_by_stream(stream_sid)
+        if conversation is not None:
+            logger.info(f"Cleaning up Twilio conversation for call: {conversation.call_sid}")
+            release_buffer(conversation)
             
     except Exception as e:
         logger.error(f"Error handling Twilio stream stop: {str(e)}")
 
+# Twilio media-stream event -> handler; other events (connected, mark) are ignored
+_EVENT_HANDLERS = {
+    'start': handle_twilio_stream_start,
+    'media': handle_twilio_media_chunk,
+    'stop': handle_twilio_stream_stop
+}
+
 def process_twilio_audio_buffer(call_sid, stream_sid, ws):
     """Process audio buffer for Twilio WebSocket"""
-    if active_conversations[call_sid]['processing']:
+    conversation = conversations.get(call_sid)
+    if conversation is None:
         return
     
-    active_conversations[call_sid]['processing'] = True
+    # Skip if a turn is already running; the audio stays buffered for the next flush
+    lock = conversation.lock
+    if not lock.acquire(blocking=False):
+        conversation.flush_scheduled = False
+        return
     
     try:
-        conversation = active_conversations[call_sid]
-        audio_buffer = conversation['audio_buffer']
-        phone_number = conversation['phone_number']
-        
-        conversation['audio_buffer'] = b''
+        # Service SDKs (Google Speech, Gemini, Twilio) load on first use, not at boot
+        from app.services.twilio_service import twilio_service
+        from app.services.speech_service import speech_service
+        from app.services.conversation_service import conversation_service
+        
+        ring = conversation.audio_buffer
+        if ring is None:
+            return  # Stream already stopped
+        audio_buffer = ring.read_all()
+        if is_silence(audio_buffer):
+            return  # Nothing said; skip the transcription call
+        phone_number = conversation.phone_number
         
         logger.info(f"Processing Twilio audio buffer for {phone_number}")
         
-        user_text = speech_service.transcribe_audio_bytes(audio_buffer)
+        # Recognition is configured for LINEAR16; Twilio sends µ-law
+        user_text = speech_service.transcribe_audio_bytes(ulaw_to_pcm16(audio_buffer))
         
         if user_text and user_text.strip():
             logger.info(f"Transcribed: {user_text}")
             
             if twilio_service.detect_conversation_end(user_text):
-                goodbye_text = "شكراً لك! إلى اللقاء."
-                send_twilio_ai_response(call_sid, goodbye_text, stream_sid, ws)
+                send_twilio_ai_response(call_sid, GOODBYE_TEXT, stream_sid, ws, cache=True)
                 return
             
-            ai_response = conversation_service.get_conversation_response(
+            # Speak each sentence as soon as Gemini finishes it
+            sentences = []
+            for sentence in conversation_service.stream_conversation_response(
                 user_input=user_text,
                 phone_number=phone_number,
                 language="arabic"
-            )
+            ):
+                sentences.append(sentence)
+                send_twilio_ai_response(call_sid, sentence.strip(), stream_sid, ws)
             
+            ai_response = "".join(sentences)
             logger.info(f"AI response: {ai_response}")
-            send_twilio_ai_response(call_sid, ai_response, stream_sid, ws)
             
-            # Update session data
-            session_data = session_middleware.get_session(phone_number)
-            session_data.update({
+            session_middleware.update_session_in_background(phone_number, {
                 'last_activity': datetime.now(),
                 'last_user_input': user_text,
                 'last_ai_response': ai_response
             })
-            session_middleware.update_session(phone_number, session_data)
             
     except Exception as e:
         logger.error(f"Error processing Twilio audio buffer: {str(e)}")
     finally:
-        if call_sid in active_conversations:
-            active_conversations[call_sid]['processing'] = False
+        conversation.flush_scheduled = False
+        lock.release()
 
-def send_twilio_ai_response(call_sid, text_response, stream_sid, ws):
-    """Send AI response via Twilio WebSocket"""
+def send_twilio_ai_response(call_sid, text_response, stream_sid, ws, cache=False):
+    """Send AI response via Twilio WebSocket; cache=True reuses audio for fixed phrases"""
     try:
         logger.info(f"Generating Twilio speech for: {text_response}")
         
         from app.services.voice_service import generate_arabic_voice
         
         # Generate audio chunks in µ-law format
-        audio_chunks = generate_arabic_voice(text_response, gender='female')
+        audio_chunks = generate_arabic_voice(text_response, gender='female', cache=cache)
         
-        # Send audio chunks to Twilio WebSocket
+        # Send audio chunks to Twilio WebSocket; only the payload varies
+        # between frames, so the JSON around it is built once
+        prefix, suffix = media_message_parts(stream_sid)
+        send = ws.send
         for chunk in audio_chunks:
-            if len(chunk) > 0:  # Only send non-empty chunks
-                audio_base64 = base64.b64encode(chunk).decode('utf-8')
-                
-                media_message = {
-                    "event": "media",
-                    "streamSid": stream_sid,
-                    "media": {
-                        "payload": audio_base64
-                    }
-                }
-                
-                ws.send(json.dumps(media_message))
+            if chunk:  # Only send non-empty chunks
+                send(prefix + b2a_base64(chunk, newline=False).decode('ascii') + suffix)
         
         logger.info("Twilio AI response audio sent successfully")
         
@@ -300,243 +342,9 @@ def send_twilio_ai_response(call_sid, text_response, stream_sid, ws):
         try:
             fallback_text = "عذراً، حدث خطأ في الاستجابة الصوتية."
             simple_audio = fallback_text.encode('utf-8')  # Simple fallback
-            audio_base64 = base64.b64encode(simple_audio).decode('utf-8')
+            audio_base64 = b2a_base64(simple_audio, newline=False).decode('ascii')
             
-            media_message = {
-                "event": "media", 
-                "streamSid": stream_sid,
-                "media": {
-                    "payload": audio_base64
-                }
-            }
-            ws.send(json.dumps(media_message))
-        except:
-            logger.error("Failed to send fallback message")
-
-# WebSocket event handlers for real-time audio streaming
-def setup_websocket_handlers(socketio):
-    """Setup WebSocket handlers for real-time conversation"""
-    
-    @socketio.on('connect')
-    def handle_connect():
-        logger.info("WebSocket connected for voice streaming")
-        emit('connected', {'status': 'Connected to voice stream'})
-    
-    @socketio.on('disconnect')
-    def handle_disconnect():
-        logger.info("WebSocket disconnected for voice streaming")
-    
-    @socketio.on('message')
-    def handle_media_stream(data):
-        """Handle incoming audio stream from Twilio"""
-        try:
-            logger.info(f"Received WebSocket message: {type(data)}")
-            
-            # Parse incoming message (could be JSON string or dict)
-            if isinstance(data, str):
-                try:
-                    media_data = json.loads(data)
-                except json.JSONDecodeError:
-                    logger.warning(f"Failed to parse JSON: {data}")
-                    return
-            else:
-                media_data = data
-            
-            event_type = media_data.get('event')
-            logger.info(f"WebSocket event: {event_type}")
-            
-            if event_type == 'start':
-                handle_stream_start(media_data)
-            elif event_type == 'media':
-                handle_media_chunk(media_data)
-            elif event_type == 'stop':
-                handle_stream_stop(media_data)
-            else:
-                logger.warning(f"Unknown event type: {event_type}")
-                    
-        except Exception as e:
-            logger.error(f"Error handling WebSocket message: {str(e)}")
-
-def handle_stream_start(data):
-    """Handle stream start event"""
-    try:
-        start_data = data.get('start', {})
-        call_sid = start_data.get('callSid')
-        stream_sid = data.get('streamSid')
-        
-        logger.info(f"Media stream started - Call SID: {call_sid}, Stream SID: {stream_sid}")
-        
-        if call_sid in active_conversations:
-            active_conversations[call_sid]['connected'] = True
-            active_conversations[call_sid]['stream_sid'] = stream_sid
-            
-            # Send welcome message with delay
-            phone_number = active_conversations[call_sid]['phone_number']
-            welcome_text = "أهلاً وسهلاً! أنا مساعدك الذكي. كيف يمكنني مساعدتك اليوم؟"
-            
-            # Add delay to ensure connection is stable
-            import time
-            def delayed_welcome():
-                time.sleep(0.5)  # Wait 500ms for connection to stabilize
-                send_ai_response(call_sid, welcome_text, stream_sid)
-            
-            Thread(target=delayed_welcome).start()
-            
-    except Exception as e:
-        logger.error(f"Error handling stream start: {str(e)}")
-
-def handle_media_chunk(data):
-    """Handle incoming media chunk"""
-    try:
-        media_payload = data.get('media', {})
-        audio_payload = media_payload.get('payload')
-        stream_sid = data.get('streamSid')
-        
-        # Find call_sid from stream_sid
-        call_sid = None
-        for cid, conv in active_conversations.items():
-            if conv.get('stream_sid') == stream_sid:
-                call_sid = cid
-                break
-        
-        if call_sid and call_sid in active_conversations and audio_payload:
-            # Decode audio data
-            try:
-                audio_data = base64.b64decode(audio_payload)
-                
-                # Add to buffer
-                active_conversations[call_sid]['audio_buffer'] += audio_data
-                
-                # Process when we have enough audio (1 second instead of 2)
-                buffer_size = len(active_conversations[call_sid]['audio_buffer'])
-                if buffer_size > 8000:  # 1 second at 8kHz mono (µ-law is 1 byte per sample)
-                    logger.info(f"Processing audio buffer of size: {buffer_size}")
-                    Thread(target=process_audio_buffer, args=(call_sid, stream_sid)).start()
-                    
-            except Exception as e:
-                logger.error(f"Error processing audio chunk: {str(e)}")
-            
-    except Exception as e:
-        logger.error(f"Error handling media chunk: {str(e)}")
-
-def handle_stream_stop(data):
-    """Handle stream stop event"""
-    try:
-        stream_sid = data.get('streamSid')
-        logger.info(f"Media stream stopped - Stream SID: {stream_sid}")
-        
-        # Find and clean up conversation
-        call_sid_to_remove = None
-        for call_sid, conv in active_conversations.items():
-            if conv.get('stream_sid') == stream_sid:
-                call_sid_to_remove = call_sid
-                break
-        
-        if call_sid_to_remove:
-            logger.info(f"Cleaning up conversation for call: {call_sid_to_remove}")
-            del active_conversations[call_sid_to_remove]
-            
-    except Exception as e:
-        logger.error(f"Error handling stream stop: {str(e)}")
-
-def process_audio_buffer(call_sid, stream_sid):
-    """Process accumulated audio buffer"""
-    if active_conversations[call_sid]['processing']:
-        return  # Already processing
-    
-    active_conversations[call_sid]['processing'] = True
-    
-    try:
-        conversation = active_conversations[call_sid]
-        audio_buffer = conversation['audio_buffer']
-        phone_number = conversation['phone_number']
-        
-        # Clear buffer
-        conversation['audio_buffer'] = b''
-        
-        logger.info(f"Processing audio buffer for {phone_number}")
-        
-        # Transcribe audio using Whisper
-        user_text = speech_service.transcribe_audio_bytes(audio_buffer)
-        
-        if user_text and user_text.strip():
-            logger.info(f"Transcribed: {user_text}")
-            
-            # Check if user wants to end conversation
-            if twilio_service.detect_conversation_end(user_text):
-                goodbye_text = "شكراً لك! إلى اللقاء."
-                send_ai_response(call_sid, goodbye_text, stream_sid)
-                return
-            
-            # Get AI response using Gemini
-            ai_response = conversation_service.get_conversation_response(
-                user_input=user_text,
-                phone_number=phone_number,
-                language="arabic"
-            )
-            
-            logger.info(f"AI response: {ai_response}")
-            
-            # Send AI response as audio
-            send_ai_response(call_sid, ai_response, stream_sid)
-            
-            # Update session data
-            session_data = session_middleware.get_session(phone_number)
-            session_data.update({
-                'last_activity': datetime.now(),
-                'last_user_input': user_text,
-                'last_ai_response': ai_response
-            })
-            session_middleware.update_session(phone_number, session_data)
-        else:
-            logger.info("No valid transcription received")
-            
-    except Exception as e:
-        logger.error(f"Error processing audio buffer: {str(e)}")
-    finally:
-        if call_sid in active_conversations:
-            active_conversations[call_sid]['processing'] = False
-
-def send_ai_response(call_sid, text_response, stream_sid):
-    """Convert text to speech and send back to Twilio"""
-    try:
-        logger.info(f"Generating speech for: {text_response}")
-        
-        # Generate audio using ElevenLabs
-        from app.services.voice_service import generate_arabic_voice
-        
-        # Generate audio chunks in µ-law format
-        audio_chunks = generate_arabic_voice(text_response, gender='female')
-        
-        # Send audio chunks via SocketIO
-        from flask_socketio import emit
-        
-        for chunk in audio_chunks:
-            if len(chunk) > 0:  # Only send non-empty chunks
-                audio_base64 = base64.b64encode(chunk).decode('utf-8')
-                
-                # Create media message for Twilio
-                media_message = {
-                    "event": "media",
-                    "streamSid": stream_sid,
-                    "media": {
-                        "payload": audio_base64
-                    }
-                }
-                
-                emit('message', json.dumps(media_message))
-        
-        logger.info("AI response audio sent successfully")
-        
-    except Exception as e:
-        logger.error(f"Error sending AI response: {str(e)}")
-        # Send fallback message
-        try:
-            from flask_socketio import emit
-            fallback_msg = {
-                "event": "error",
-                "message": "عذراً، حدث خطأ في الاستجابة الصوتية."
-            }
-            emit('message', json.dumps(fallback_msg))
+            prefix, suffix = media_message_parts(stream_sid)
+            ws.send(prefix + audio_base64 + suffix)
         except:
             logger.error("Failed to send fallback message")
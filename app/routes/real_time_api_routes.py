@@ -1,6 +1,10 @@
 from flask import Blueprint, jsonify, request, Response
 from flask_socketio import SocketIO, emit
 from flask_sock import Sock
+from app.twilio_frames import decode_frame, media_message_parts
+from app.call_registry import CallState, ConversationRegistry
+from app.services.audio_utils import ulaw_to_pcm16
+from werkzeug.exceptions import HTTPException
 from app.services.twilio_service import twilio_service
 from app.services.speech_service import speech_service
 from app.services.conversation_service import conversation_service
@@ -11,126 +15,145 @@ from app.middleware.request_handler import (
 )
 from datetime import datetime
 import logging
-import json
-import base64
+import orjson
+import hashlib
+import msgspec
+from binascii import a2b_base64, b2a_base64
 import asyncio
-from threading import Thread
+from app.services.event_loop import BoundedExecutor, call_later
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # WebSocket URL configuration
 WEBSOCKET_URL = "wss://a0da8bdf9611.ngrok-free.app/ws"
 
+START_ERROR_MESSAGE = "عذراً، حدث خطأ في بدء المحادثة."
+
+# TwiML served to every incoming call and its error fallback, rendered and
+# encoded at boot so responses skip both the build and the utf-8 encode
+STREAM_TWIML = twilio_service.create_stream_response(websocket_url=WEBSOCKET_URL).encode('utf-8')
+START_ERROR_TWIML = twilio_service.create_error_response(START_ERROR_MESSAGE).encode('utf-8')
+
+# Fixed phrases; their audio is synthesized once and replayed
+WELCOME_TEXT = "أهلاً وسهلاً! أنا مساعدك الذكي. كيف يمكنني مساعدتك اليوم؟"
+GOODBYE_TEXT = "شكراً لك! إلى اللقاء."
+
 # Create the blueprint
 api_bp = Blueprint('api', __name__)
 
-# Store active conversations with streaming sessions
-active_conversations = {}
-streaming_sessions = {}
+# Body returned for any unhandled error in a JSON endpoint
+_INTERNAL_ERROR = {
+    "error": "Request processing failed",
+    "status": "error"
+}
+
+@api_bp.errorhandler(Exception)
+def handle_unexpected_error(e):
+    """Uniform JSON error for JSON endpoints; HTTP errors pass through"""
+    if isinstance(e, HTTPException):
+        return e
+    
+    logger.exception(f"Unhandled error on {request.path}: {str(e)}")
+    return jsonify(_INTERNAL_ERROR), 500
+
+# Workers for final transcriptions (Gemini + TTS); bounded so a burst of
+# results cannot fan out into unbounded threads or an unbounded queue
+_TURN_EXECUTOR = BoundedExecutor(max_workers=16, max_pending=64, thread_name_prefix='turn')
+
+# Inbound µ-law is forwarded to the recognizer in 100ms batches (5 Twilio
+# frames) instead of one call per 20ms frame
+AUDIO_BATCH_BYTES = 800
+
+# Active calls with their streaming sessions, by call SID and stream SID
+conversations = ConversationRegistry()
+
+# The home payload never changes, so serialize it once at import time
+_HOME_BODY = orjson.dumps({
+    "message": "Welcome to the AI Voice Assistant API!",
+    "status": "success",
+    "description": "Real-time voice conversation using Google Speech-to-Text, Gemini AI, and ElevenLabs",
+    "features": {
+        "speech_to_text": "Google Speech-to-Text (Real-time Streaming)",
+        "ai_conversation": "Google Gemini",
+        "text_to_speech": "ElevenLabs (Arabic Syrian)",
+        "real_time": "WebSocket Streaming with Live Transcription"
+    },
+    "endpoints": {
+        "/voice": "Initial call endpoint - starts WebSocket stream",
+        "/ws": "WebSocket endpoint for real-time audio streaming (Flask-Sock)"
+    },
+    "websocket_url": WEBSOCKET_URL,
+    "websocket_info": {
+        "protocol": "Twilio Media Streaming",
+        "audio_format": "µ-law encoded audio",
+        "sample_rate": "8000Hz",
+        "transcription": "Real-time Google Speech-to-Text"
+    }
+})
+_HOME_ETAG = hashlib.sha1(_HOME_BODY).hexdigest()
 
 @api_bp.route('/', methods=['GET'])
 def home():
     """Home route that returns a welcome message"""
-    return jsonify({
-        "message": "Welcome to the AI Voice Assistant API!",
-        "status": "success",
-        "description": "Real-time voice conversation using Google Speech-to-Text, Gemini AI, and ElevenLabs",
-        "features": {
-            "speech_to_text": "Google Speech-to-Text (Real-time Streaming)",
-            "ai_conversation": "Google Gemini",
-            "text_to_speech": "ElevenLabs (Arabic Syrian)",
-            "real_time": "WebSocket Streaming with Live Transcription"
-        },
-        "endpoints": {
-            "/voice": "Initial call endpoint - starts WebSocket stream",
-            "/ws": "WebSocket endpoint for real-time audio streaming (Flask-Sock)"
-        },
-        "websocket_url": WEBSOCKET_URL,
-        "websocket_info": {
-            "protocol": "Twilio Media Streaming",
-            "audio_format": "µ-law encoded audio",
-            "sample_rate": "8000Hz",
-            "transcription": "Real-time Google Speech-to-Text"
-        }
-    })
+    response = Response(_HOME_BODY, mimetype='application/json')
+    response.set_etag(_HOME_ETAG)
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
 
 @api_bp.route('/data', methods=['POST'])
 def handle_post_request():
     """Handle generic POST requests with JSON data"""
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "error": "No JSON data received",
-                "status": "error"
-            }), 400
-            
-        return jsonify({
-            "message": "Data received successfully",
-            "received_data": data,
-            "status": "success"
-        }), 200
-        
-    except Exception as e:
+    data = request.get_json(silent=True, cache=False)
+    
+    if not data:
         return jsonify({
-            "error": f"Request processing failed: {str(e)}",
+            "error": "No JSON data received",
             "status": "error"
-        }), 500
+        }), 400
+        
+    return jsonify({
+        "message": "Data received successfully",
+        "received_data": data,
+        "status": "success"
+    }), 200
 
 @api_bp.route('/echo', methods=['POST'])
 def echo_request():
     """Echo endpoint that returns the same data sent to it"""
-    try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                "error": "No data to echo",
-                "status": "error"
-            }), 400
-            
-        return jsonify({
-            "echo": data,
-            "status": "success"
-        }), 200
-        
-    except Exception as e:
+    data = request.get_json(silent=True, cache=False)
+    
+    if not data:
         return jsonify({
-            "error": f"Echo failed: {str(e)}",
+            "error": "No data to echo",
             "status": "error"
-        }), 500
+        }), 400
+        
+    return jsonify({
+        "echo": data,
+        "status": "success"
+    }), 200
 
 @api_bp.route('/form', methods=['POST'])
 def handle_form_data():
     """Handle form data POST requests"""
-    try:
-        form_data = request.form.to_dict()
-        
-        if not form_data:
-            return jsonify({
-                "error": "No form data received",
-                "status": "error"
-            }), 400
-            
-        return jsonify({
-            "message": "Form data received successfully",
-            "form_data": form_data,
-            "status": "success"
-        }), 200
-        
-    except Exception as e:
+    form_data = request.form.to_dict()
+    
+    if not form_data:
         return jsonify({
-            "error": f"Form processing failed: {str(e)}",
+            "error": "No form data received",
             "status": "error"
-        }), 500
+        }), 400
+        
+    return jsonify({
+        "message": "Form data received successfully",
+        "form_data": form_data,
+        "status": "success"
+    }), 200
 
 @api_bp.route('/voice', methods=['POST'])
-@twilio_middleware
-@session_middleware
-@request_logger
+@twilio_middleware.validate_twilio_request
+@request_logger.log_request
 def handle_voice():
     """Handle Twilio voice requests and initiate real-time streaming"""
     try:
@@ -141,27 +164,19 @@ def handle_voice():
         logger.info(f"Voice call initiated - From: {from_number}, To: {to_number}, Call SID: {call_sid}")
         
         # Initialize conversation state
-        active_conversations[call_sid] = {
-            'phone_number': from_number,
-            'call_sid': call_sid,
-            'audio_buffer': b'',
-            'processing': False,
-            'connected': False,
-            'stream_sid': None,
-            'websocket': None,
-            'conversation_started': datetime.now()
-        }
+        state = CallState(call_sid=call_sid, phone_number=from_number)
+        conversations.add(state)
         
         # Create streaming session for real-time transcription
+        # These run on the recognition thread, which must keep draining
+        # responses; the speech service already logs each result
         def on_interim_result(text):
-            logger.debug(f"Interim transcription: {text}")
-            # Optionally handle partial results for better UX
+            pass  # Optionally handle partial results for better UX
         
         def on_final_result(text, confidence):
-            logger.info(f"Final transcription: '{text}' (confidence: {confidence:.2f})")
-            if call_sid in active_conversations:
+            if call_sid in conversations:
                 # Process the final transcription
-                Thread(target=process_transcription_result, args=(call_sid, text)).start()
+                _TURN_EXECUTOR.try_submit(process_transcription_result, call_sid, text)
         
         def on_error(error):
             logger.error(f"Streaming transcription error: {error}")
@@ -174,32 +189,27 @@ def handle_voice():
         )
         
         if streaming_session:
-            streaming_sessions[call_sid] = streaming_session
+            state.streaming_session = streaming_session
             streaming_session.start()
             logger.info(f"Started streaming session for call {call_sid}")
         
-        # Generate TwiML to start media streaming
-        twiml_response = twilio_service.create_stream_response(
-            websocket_url=WEBSOCKET_URL
-        )
-        
-        return Response(twiml_response, mimetype='text/xml')
+        # TwiML to start media streaming
+        return Response(STREAM_TWIML, mimetype='text/xml')
         
     except Exception as e:
         logger.error(f"Error starting WebSocket conversation: {str(e)}")
-        error_response = twilio_service.create_error_response("عذراً، حدث خطأ في بدء المحادثة.")
-        return Response(error_response, mimetype='text/xml')
+        return Response(START_ERROR_TWIML, mimetype='text/xml')
 
 def process_transcription_result(call_sid, user_text):
     """Process the final transcription result"""
     try:
-        if call_sid not in active_conversations:
+        conversation = conversations.get(call_sid)
+        if conversation is None:
             return
         
-        conversation = active_conversations[call_sid]
-        phone_number = conversation['phone_number']
-        stream_sid = conversation.get('stream_sid')
-        ws = conversation.get('websocket')
+        phone_number = conversation.phone_number
+        stream_sid = conversation.stream_sid
+        ws = conversation.websocket
         
         if not user_text or not user_text.strip():
             return
@@ -208,32 +218,29 @@ def process_transcription_result(call_sid, user_text):
         
         # Check for conversation end
         if twilio_service.detect_conversation_end(user_text):
-            goodbye_text = "شكراً لك! إلى اللقاء."
-            send_twilio_ai_response(call_sid, goodbye_text, stream_sid, ws)
+            send_twilio_ai_response(call_sid, GOODBYE_TEXT, stream_sid, ws, cache=True)
             cleanup_conversation(call_sid)
             return
         
-        # Get AI response
-        ai_response = conversation_service.get_conversation_response(
+        # Get AI response, speaking each sentence as soon as Gemini finishes it
+        sentences = []
+        for sentence in conversation_service.stream_conversation_response(
             user_input=user_text,
             phone_number=phone_number,
             language="arabic"
-        )
+        ):
+            sentences.append(sentence)
+            if stream_sid and ws:
+                send_twilio_ai_response(call_sid, sentence.strip(), stream_sid, ws)
         
+        ai_response = "".join(sentences)
         logger.info(f"AI response: {ai_response}")
         
-        # Send AI response
-        if stream_sid and ws:
-            send_twilio_ai_response(call_sid, ai_response, stream_sid, ws)
-        
-        # Update session data
-        session_data = session_middleware.get_session(phone_number)
-        session_data.update({
+        session_middleware.update_session_in_background(phone_number, {
             'last_activity': datetime.now(),
             'last_user_input': user_text,
             'last_ai_response': ai_response
         })
-        session_middleware.update_session(phone_number, session_data)
         
     except Exception as e:
         logger.error(f"Error processing transcription result: {str(e)}")
@@ -241,16 +248,17 @@ def process_transcription_result(call_sid, user_text):
 def cleanup_conversation(call_sid):
     """Clean up conversation and streaming session"""
     try:
+        conversation = conversations.remove(call_sid)
+        if conversation is None:
+            return
+        
         # Stop streaming session
-        if call_sid in streaming_sessions:
-            streaming_sessions[call_sid].stop()
-            del streaming_sessions[call_sid]
+        if conversation.streaming_session is not None:
+            conversation.streaming_session.stop()
+            conversation.streaming_session = None
             logger.info(f"Stopped streaming session for call {call_sid}")
         
-        # Remove conversation
-        if call_sid in active_conversations:
-            del active_conversations[call_sid]
-            logger.info(f"Cleaned up conversation for call {call_sid}")
+        logger.info(f"Cleaned up conversation for call {call_sid}")
             
     except Exception as e:
         logger.error(f"Error cleaning up conversation {call_sid}: {str(e)}")
@@ -264,25 +272,30 @@ def setup_websocket_routes(sock):
         """Handle Twilio WebSocket connection with real-time transcription"""
         logger.info("Twilio WebSocket connection established")
         
+        # Bound once; this loop runs for every 20ms media frame
+        receive = ws.receive
+        decode = decode_frame
+        handlers = _EVENT_HANDLERS
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
+        
         try:
             while True:
-                message = ws.receive()
+                message = receive()
                 if message:
                     try:
-                        data = json.loads(message)
-                        event_type = data.get('event')
+                        data = decode(message)
+                        event_type = data.event
                         
-                        logger.debug(f"Received Twilio WebSocket event: {event_type}")
+                        if debug_enabled:
+                            logger.debug("Received Twilio WebSocket event: %s", event_type)
                         
-                        if event_type == 'start':
-                            handle_twilio_stream_start(data, ws)
-                        elif event_type == 'media':
-                            handle_twilio_media_chunk(data, ws)
-                        elif event_type == 'stop':
-                            handle_twilio_stream_stop(data, ws)
+                        handler = handlers.get(event_type)
+                        if handler:
+                            handler(data, ws)
+                        if event_type == 'stop':
                             break
                             
-                    except json.JSONDecodeError as e:
+                    except msgspec.DecodeError as e:
                         logger.error(f"Failed to parse WebSocket message: {e}")
                     except Exception as e:
                         logger.error(f"Error processing WebSocket message: {e}")
@@ -295,25 +308,15 @@ def setup_websocket_routes(sock):
 def handle_twilio_stream_start(data, ws):
     """Handle Twilio stream start via direct WebSocket"""
     try:
-        start_data = data.get('start', {})
-        call_sid = start_data.get('callSid')
-        stream_sid = data.get('streamSid')
+        call_sid = data.start.callSid
+        stream_sid = data.streamSid
         
         logger.info(f"Twilio stream started - Call SID: {call_sid}, Stream SID: {stream_sid}")
         
-        if call_sid in active_conversations:
-            active_conversations[call_sid]['connected'] = True
-            active_conversations[call_sid]['stream_sid'] = stream_sid
-            active_conversations[call_sid]['websocket'] = ws
-            
-            # Send welcome message after a short delay
-            def delayed_welcome():
-                import time
-                time.sleep(0.5)  # Wait 500ms for connection to stabilize
-                welcome_text = "أهلاً وسهلاً! أنا مساعدك الذكي. كيف يمكنني مساعدتك اليوم؟"
-                send_twilio_ai_response(call_sid, welcome_text, stream_sid, ws)
-            
-            Thread(target=delayed_welcome).start()
+        if conversations.attach_stream(call_sid, stream_sid, ws) is not None:
+            # Send welcome message after a short delay for the connection to stabilize
+            call_later(0.5, _TURN_EXECUTOR, send_twilio_ai_response,
+                       call_sid, WELCOME_TEXT, stream_sid, ws, cache=True)
             
     except Exception as e:
         logger.error(f"Error handling Twilio stream start: {str(e)}")
@@ -321,30 +324,27 @@ def handle_twilio_stream_start(data, ws):
 def handle_twilio_media_chunk(data, ws):
     """Handle Twilio media chunk with real-time streaming transcription"""
     try:
-        media_payload = data.get('media', {})
-        audio_payload = media_payload.get('payload')
-        stream_sid = data.get('streamSid')
-        
-        # Find call_sid from stream_sid
-        call_sid = None
-        for cid, conv in active_conversations.items():
-            if conv.get('stream_sid') == stream_sid:
-                call_sid = cid
-                break
-        
-        if call_sid and call_sid in active_conversations and audio_payload:
+        audio_payload = data.media.payload
+        stream_sid = data.streamSid
+        
+        conversation = conversations.get_by_stream(stream_sid)
+        
+        if conversation is not None and audio_payload:
             try:
                 # Decode µ-law audio data
-                audio_data = base64.b64decode(audio_payload)
+                buffer = conversation.audio_buffer
+                buffer += a2b_base64(audio_payload)  # Twilio payloads are clean base64
+                if len(buffer) < AUDIO_BATCH_BYTES:
+                    return
                 
-                # Convert µ-law to PCM for Google Speech
-                # µ-law is 8-bit, need to convert to 16-bit PCM
-                import audioop
-                pcm_data = audioop.ulaw2lin(audio_data, 2)  # Convert to 16-bit PCM
+                # Convert the batch to 16-bit PCM for Google Speech
+                pcm_data = ulaw_to_pcm16(bytes(buffer))
+                buffer.clear()
                 
                 # Send to streaming session
-                if call_sid in streaming_sessions:
-                    streaming_sessions[call_sid].add_audio_data(pcm_data)
+                session = conversation.streaming_session
+                if session is not None:
+                    session.add_audio_data(pcm_data)
                     
             except Exception as e:
                 logger.error(f"Error processing Twilio audio chunk: {str(e)}")
@@ -355,46 +355,41 @@ def handle_twilio_media_chunk(data, ws):
 def handle_twilio_stream_stop(data, ws):
     """Handle Twilio stream stop via direct WebSocket"""
     try:
-        stream_sid = data.get('streamSid')
+        stream_sid = data.streamSid
         logger.info(f"Twilio stream stopped - Stream SID: {stream_sid}")
         
         # Find and clean up conversation
-        call_sid_to_remove = None
-        for call_sid, conv in active_conversations.items():
-            if conv.get('stream_sid') == stream_sid:
-                call_sid_to_remove = call_sid
-                break
-        
-        if call_sid_to_remove:
-            cleanup_conversation(call_sid_to_remove)
+        conversation = conversations.get_by_stream(stream_sid)
+        if conversation is not None:
+            cleanup_conversation(conversation.call_sid)
             
     except Exception as e:
         logger.error(f"Error handling Twilio stream stop: {str(e)}")
 
-def send_twilio_ai_response(call_sid, text_response, stream_sid, ws):
-    """Send AI response via Twilio WebSocket"""
+# Twilio media-stream event -> handler; other events (connected, mark) are ignored
+_EVENT_HANDLERS = {
+    'start': handle_twilio_stream_start,
+    'media': handle_twilio_media_chunk,
+    'stop': handle_twilio_stream_stop
+}
+
+def send_twilio_ai_response(call_sid, text_response, stream_sid, ws, cache=False):
+    """Send AI response via Twilio WebSocket; cache=True reuses audio for fixed phrases"""
     try:
         logger.info(f"Generating Twilio speech for: {text_response}")
         
         from app.services.voice_service import generate_arabic_voice
         
         # Generate audio chunks in µ-law format
-        audio_chunks = generate_arabic_voice(text_response, gender='female')
+        audio_chunks = generate_arabic_voice(text_response, gender='female', cache=cache)
         
-        # Send audio chunks to Twilio WebSocket
+        # Send audio chunks to Twilio WebSocket; only the payload varies
+        # between frames, so the JSON around it is built once
+        prefix, suffix = media_message_parts(stream_sid)
+        send = ws.send
         for chunk in audio_chunks:
-            if len(chunk) > 0:  # Only send non-empty chunks
-                audio_base64 = base64.b64encode(chunk).decode('utf-8')
-                
-                media_message = {
-                    "event": "media",
-                    "streamSid": stream_sid,
-                    "media": {
-                        "payload": audio_base64
-                    }
-                }
-                
-                ws.send(json.dumps(media_message))
+            if chunk:  # Only send non-empty chunks
+                send(prefix + b2a_base64(chunk, newline=False).decode('ascii') + suffix)
         
         logger.info("Twilio AI response audio sent successfully")
         
@@ -402,14 +397,9 @@ def send_twilio_ai_response(call_sid, text_response, stream_sid, ws):
         logger.error(f"Error sending Twilio AI response: {str(e)}")
         # Send a fallback message
         try:
-            fallback_message = {
-                "event": "media",
-                "streamSid": stream_sid,
-                "media": {
-                    "payload": ""  # Empty payload to indicate end
-                }
-            }
-            ws.send(json.dumps(fallback_message))
+            # Empty payload to indicate end
+            prefix, suffix = media_message_parts(stream_sid)
+            ws.send(prefix + suffix)
         except:
             pass
 
@@ -492,8 +482,8 @@ def health_check():
                 "twilio": True,
                 "conversation": True
             },
-            "active_conversations": len(active_conversations),
-            "streaming_sessions": len(streaming_sessions),
+            "active_conversations": len(conversations),
+            "streaming_sessions": conversations.streaming_session_count(),
             "timestamp": datetime.now().isoformat()
         })
         
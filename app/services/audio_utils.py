@@ -0,0 +1,160 @@
+import logging
+
+try:
+    import audioop
+except ImportError:  # Removed in Python 3.13
+    audioop = None
+
+logger = logging.getLogger(__name__)
+
+class AudioRing:
+    """
+    Single-producer/single-consumer ring buffer for a call's inbound audio
+    
+    The media handler is the only writer and the turn processor the only
+    reader. Each side advances its own position, and int assignment is
+    atomic under the GIL, so neither side needs a lock.
+    """
+    
+    __slots__ = ('buf', 'capacity', 'mask', 'write_pos', 'read_pos', 'dropped')
+    
+    def __init__(self, capacity: int = 65536):
+        """
+        Args:
+            capacity (int): Buffer size in bytes; must be a power of two
+        """
+        if capacity <= 0 or capacity & (capacity - 1):
+            raise ValueError("AudioRing capacity must be a power of two")
+        
+        self.buf = bytearray(capacity)
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.write_pos = 0
+        self.read_pos = 0
+        self.dropped = 0  # bytes discarded since the ring was last drained
+    
+    def __len__(self) -> int:
+        return self.write_pos - self.read_pos
+    
+    def write(self, data: bytes) -> int:
+        """
+        Append audio, dropping whatever does not fit
+        
+        The oldest audio is never overwritten because the reader owns
+        read_pos; when the ring is full the newest bytes are discarded.
+        
+        Args:
+            data (bytes): Audio to append
+            
+        Returns:
+            int: Number of buffered bytes after the write
+        """
+        write_pos = self.write_pos
+        free = self.capacity - (write_pos - self.read_pos)
+        n = len(data)
+        if n > free:
+            # Warn once per overflow; the total is reported when drained
+            if not self.dropped:
+                logger.warning("Audio ring full, dropping audio until it is drained")
+            self.dropped += n - free
+            data = data[:free]
+            n = free
+        
+        start = write_pos & self.mask
+        first = min(n, self.capacity - start)
+        self.buf[start:start + first] = data[:first]
+        if first < n:
+            # Wrap around to the start of the buffer
+            self.buf[:n - first] = data[first:]
+        
+        # Publish only after the bytes are in place
+        self.write_pos = write_pos + n
+        return self.write_pos - self.read_pos
+    
+    def read_all(self) -> bytes:
+        """
+        Take everything written so far
+        
+        Returns:
+            bytes: Buffered audio, oldest first
+        """
+        write_pos = self.write_pos
+        read_pos = self.read_pos
+        start = read_pos & self.mask
+        end = start + (write_pos - read_pos)
+        
+        if end <= self.capacity:
+            data = bytes(self.buf[start:end])
+        else:
+            data = bytes(self.buf[start:]) + bytes(self.buf[:end - self.capacity])
+        
+        self.read_pos = write_pos
+        
+        if self.dropped:
+            logger.warning("Audio ring dropped %d bytes while full", self.dropped)
+            self.dropped = 0
+        return data
+    
+    def reset(self):
+        """Empty the ring; only safe while nothing is reading or writing"""
+        self.write_pos = 0
+        self.read_pos = 0
+        self.dropped = 0
+
+def _ulaw_to_linear(code: int) -> int:
+    """G.711 µ-law code to a 16-bit linear sample"""
+    code = ~code & 0xFF
+    exponent = (code >> 4) & 0x07
+    sample = ((((code & 0x0F) << 3) + 0x84) << exponent) - 0x84
+    return -sample if code & 0x80 else sample
+
+# Low and high bytes of each code's little-endian PCM16 sample, as
+# bytes.translate tables
+_ULAW_PCM_LO = bytes(_ulaw_to_linear(b) & 0xFF for b in range(256))
+_ULAW_PCM_HI = bytes((_ulaw_to_linear(b) >> 8) & 0xFF for b in range(256))
+
+def ulaw_to_pcm16(data: bytes) -> bytes:
+    """
+    Decode µ-law to little-endian 16-bit PCM (LINEAR16)
+    
+    Uses audioop while it exists. Without it, two table lookups through
+    bytes.translate fill the low and high bytes of every sample, which
+    still runs in C.
+    
+    Args:
+        data (bytes): µ-law audio
+        
+    Returns:
+        bytes: PCM16 audio, twice the length of data
+    """
+    if audioop is not None:
+        return audioop.ulaw2lin(data, 2)
+    
+    pcm = bytearray(len(data) * 2)
+    pcm[0::2] = data.translate(_ULAW_PCM_LO)
+    pcm[1::2] = data.translate(_ULAW_PCM_HI)
+    return bytes(pcm)
+
+# µ-law codes within 8 steps of zero on either sign (0x77-0x7F, 0xF7-0xFF);
+# µ-law stores the magnitude inverted, so quiet samples have high low bits
+ULAW_QUIET_CODES = bytes(b for b in range(256) if (b & 0x7F) >= 0x77)
+
+def is_silence(buf: bytes, thresh: float = 0.02) -> bool:
+    """
+    Check whether a µ-law buffer is (near) silence
+    
+    Quiet codes are deleted with bytes.translate, which runs in C, and
+    whatever remains is counted as active audio.
+    
+    Args:
+        buf (bytes): µ-law audio
+        thresh (float): Fraction of active samples below which the buffer is silent
+        
+    Returns:
+        bool: True if the buffer holds no speech worth transcribing
+    """
+    if not buf:
+        return True
+    
+    active = len(buf.translate(None, ULAW_QUIET_CODES))
+    return active / len(buf) < thresh
@@ -1,27 +1,78 @@
 import google.generativeai as genai
 from app.config import Config
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+from array import array
+from collections import OrderedDict
 import logging
+import math
+import operator
+import re
+import threading
+import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Arabic diacritics (harakat) and tatweel, ignored when matching utterances
+_ARABIC_DIACRITICS = re.compile('[\u0640\u064B-\u0652]')
+_WHITESPACE = re.compile(r'\s+')
+
+# Dot product in one C call where available (Python 3.12+)
+_dot = getattr(math, 'sumprod', None) or (lambda a, b: sum(map(operator.mul, a, b)))
+
+# Sentence boundaries in streamed replies: terminal punctuation followed by
+# whitespace (so "3.5" does not split), or a line break
+_SENTENCE_END = re.compile('[.!?\u061F\u2026]+\\s+|\\n+')
+
 class ConversationService:
     """Service for handling conversations with Gemini AI"""
     
+    # Replies to context-free opening utterances are reused for this long
+    RESPONSE_CACHE_SIZE = 10000
+    RESPONSE_CACHE_TTL = 3600  # seconds
+    
+    # Callers whose history is kept; idle histories are dropped after the TTL
+    HISTORY_SIZE = 10000
+    HISTORY_TTL = 3600  # seconds
+    
+    # Embeddings of recent cached openings searched for near-duplicates
+    SEMANTIC_CACHE_SIZE = 256
+    EMBEDDING_MODEL = 'models/text-embedding-004'
+    EMBEDDING_DIMENSIONS = 256  # truncated from 768; plenty for short utterances
+    
     def __init__(self):
         self.api_key = Config.GEMINI_API_KEY
         
         if self.api_key:
-            genai.configure(api_key=self.api_key)
+            # One gRPC channel (HTTP/2, kept alive) is shared by every turn
+            genai.configure(api_key=self.api_key, transport='grpc')
             self.model = genai.GenerativeModel('gemini-2.5-flash-latest')
         else:
             self.model = None
             logger.warning("Gemini API key not configured")
         
-        # Store conversation context (in production, use a proper database)
-        self.conversation_history: Dict[str, List[Dict]] = {}
+        # Store conversation context (in production, use a proper database),
+        # in LRU order with the monotonic time each caller was last seen
+        self.conversation_history: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._history_seen: Dict[str, float] = {}
+        self._history_lock = threading.Lock()
+        
+        # (normalized utterance, language) -> (expiry, response), in LRU order
+        self._response_cache: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+        
+        # Embeddings of recent openings packed row by row into one preallocated
+        # float32 block, with each row's (language, expiry, response) alongside;
+        # rows are overwritten oldest first
+        self._semantic_vectors = array('f', bytes(4 * self.SEMANTIC_CACHE_SIZE * self.EMBEDDING_DIMENSIONS))
+        self._semantic_entries: List[Optional[Tuple[str, float, str]]] = [None] * self.SEMANTIC_CACHE_SIZE
+        self._semantic_next = 0
+        self.semantic_cache_enabled = bool(self.model) and Config.SEMANTIC_CACHE_ENABLED
+        
+        # System context is fixed per language, so the prompt prefix is built once
+        self._prompt_prefix = {
+            language: self._build_context(language) + "\n\n"
+            for language in ("arabic", "english")
+        }
     
     def get_conversation_response(self, user_input: str, phone_number: str, language: str = "arabic") -> str:
         """
@@ -35,34 +86,184 @@ class ConversationService:
         Returns:
             str: AI generated response
         """
+        return "".join(self.stream_conversation_response(user_input, phone_number, language))
+    
+    def stream_conversation_response(self, user_input: str, phone_number: str,
+                                     language: str = "arabic") -> Iterator[str]:
+        """
+        Get AI response for user input one sentence at a time
+        
+        Sentences are yielded as Gemini streams them, so speech for the
+        first one can start while the rest is still being generated.
+        
+        Args:
+            user_input (str): User's spoken input
+            phone_number (str): Unique identifier for conversation session
+            language (str): Response language preference
+            
+        Returns:
+            Iterator[str]: Sentences of the AI response; joined they form the full response
+        """
         if not self.model:
-            return "عذراً، خدمة المحادثة غير متاحة حالياً"
+            yield "عذراً، خدمة المحادثة غير متاحة حالياً"
+            return
         
+        sentences = []
         try:
-            # Initialize conversation history for new users
-            if phone_number not in self.conversation_history:
-                self.conversation_history[phone_number] = []
+            history = self._get_history(phone_number)
+            
+            # Without prior turns the prompt depends only on the utterance,
+            # so common openings ("مرحبا", "نعم") can skip Gemini entirely
+            cache_key = None
+            embedding = None
+            if not history:
+                cache_key = (self._normalize_utterance(user_input), language.lower())
+                cached_response = self._get_cached_response(cache_key)
+                if cached_response is None and self.semantic_cache_enabled:
+                    embedding = self._embed(cache_key[0])
+                    cached_response = self._get_similar_response(cache_key[1], embedding)
+                if cached_response is not None:
+                    logger.info(f"Using cached response for {phone_number}")
+                    self._update_conversation_history(phone_number, user_input, cached_response)
+                    yield cached_response
+                    return
             
             # Build conversation context
-            context = self._build_context(language)
-            full_prompt = self._build_conversation_prompt(user_input, phone_number, context)
+            prefix = self._prompt_prefix.get(language.lower(), self._prompt_prefix["english"])
+            full_prompt = self._build_conversation_prompt(user_input, history, prefix)
             
             logger.info(f"Sending prompt to Gemini for {phone_number}")
             
-            # Generate response
-            response = self.model.generate_content(full_prompt)
-            ai_response = response.text.strip()
+            # Generate response, releasing each sentence once it is complete
+            pending = ""
+            for chunk in self.model.generate_content(full_prompt, stream=True):
+                pending += chunk.text
+                split_at = self._last_sentence_end(pending)
+                if not split_at:
+                    continue
+                
+                sentence, pending = pending[:split_at].strip(), pending[split_at:]
+                if sentence:
+                    # Sentences are space-separated so the pieces join into the response
+                    yield " " + sentence if sentences else sentence
+                    sentences.append(sentence)
+            
+            sentence = pending.strip()
+            if sentence:
+                yield " " + sentence if sentences else sentence
+                sentences.append(sentence)
+            
+            ai_response = " ".join(sentences)
             
             # Store conversation history
             self._update_conversation_history(phone_number, user_input, ai_response)
             
-            logger.info(f"Generated response for {phone_number}: {ai_response[:100]}...")
+            if cache_key is not None:
+                self._cache_response(cache_key, ai_response, embedding)
             
-            return ai_response
+            logger.info(f"Generated response for {phone_number}: {ai_response[:100]}...")
                 
         except Exception as e:
             logger.error(f"Error in conversation service: {str(e)}")
-            return "عذراً، حدث خطأ تقني. يرجى المحاولة مرة أخرى"
+            if not sentences:
+                yield "عذراً، حدث خطأ تقني. يرجى المحاولة مرة أخرى"
+    
+    @staticmethod
+    def _last_sentence_end(text: str) -> int:
+        """Index just past the last complete sentence in text, or 0 if there is none"""
+        end = 0
+        for match in _SENTENCE_END.finditer(text):
+            end = match.end()
+        return end
+    
+    @staticmethod
+    def _normalize_utterance(user_input: str) -> str:
+        """Normalize an utterance for response cache lookups"""
+        text = _ARABIC_DIACRITICS.sub('', user_input.lower())
+        return _WHITESPACE.sub(' ', text).strip()
+    
+    def _get_cached_response(self, cache_key: Tuple[str, str]) -> Optional[str]:
+        """Return a cached response that has not expired yet"""
+        with self._response_cache_lock:
+            entry = self._response_cache.get(cache_key)
+            if entry is None:
+                return None
+            
+            expires_at, response = entry
+            if expires_at < time.monotonic():
+                del self._response_cache[cache_key]
+                return None
+            
+            self._response_cache.move_to_end(cache_key)
+            return response
+    
+    def _cache_response(self, cache_key: Tuple[str, str], response: str,
+                        embedding: Optional[array] = None):
+        """Store a response, evicting the least recently used entries"""
+        expires_at = time.monotonic() + self.RESPONSE_CACHE_TTL
+        with self._response_cache_lock:
+            self._response_cache[cache_key] = (expires_at, response)
+            self._response_cache.move_to_end(cache_key)
+            while len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+            
+            if embedding is not None:
+                row = self._semantic_next % self.SEMANTIC_CACHE_SIZE
+                offset = row * self.EMBEDDING_DIMENSIONS
+                self._semantic_vectors[offset:offset + self.EMBEDDING_DIMENSIONS] = embedding
+                self._semantic_entries[row] = (cache_key[1], expires_at, response)
+                self._semantic_next += 1
+    
+    def _embed(self, text: str) -> Optional[array]:
+        """
+        Unit-length Gemini embedding of an utterance for similarity lookups
+        
+        Returns:
+            Optional[array]: float32 embedding, or None if the request failed
+        """
+        try:
+            result = genai.embed_content(model=self.EMBEDDING_MODEL, content=text,
+                                         task_type='semantic_similarity',
+                                         output_dimensionality=self.EMBEDDING_DIMENSIONS)
+            vector = result['embedding']
+        except Exception as e:
+            logger.warning(f"Embedding failed, skipping semantic cache: {str(e)}")
+            return None
+        
+        if len(vector) != self.EMBEDDING_DIMENSIONS:
+            logger.warning(f"Unexpected embedding size {len(vector)}, skipping semantic cache")
+            return None
+        
+        norm = math.sqrt(_dot(vector, vector))
+        return array('f', (value / norm for value in vector)) if norm else None
+    
+    def _get_similar_response(self, language: str, embedding: Optional[array]) -> Optional[str]:
+        """Return the cached response whose utterance is most similar above the threshold"""
+        if embedding is None:
+            return None
+        
+        now = time.monotonic()
+        dimensions = self.EMBEDDING_DIMENSIONS
+        best_score = Config.SEMANTIC_CACHE_THRESHOLD
+        best_response = None
+        
+        with self._response_cache_lock:
+            # Rows are read in place through the view; nothing is copied
+            vectors = memoryview(self._semantic_vectors)
+            for row, entry in enumerate(self._semantic_entries):
+                if entry is None or entry[0] != language or entry[1] < now:
+                    continue
+                
+                # Both vectors are unit length, so the dot product is the cosine
+                offset = row * dimensions
+                score = _dot(embedding, vectors[offset:offset + dimensions])
+                if score >= best_score:
+                    best_score, best_response = score, entry[2]
+            vectors.release()
+        
+        if best_response is not None:
+            logger.info(f"Semantic cache hit (similarity {best_score:.2f})")
+        return best_response
     
     def _build_context(self, language: str) -> str:
         """Build conversation context and personality"""
@@ -85,40 +286,65 @@ class ConversationService:
             - Show interest and warmth in conversation
             - Keep answers brief and suitable for phone conversations."""
     
-    def _build_conversation_prompt(self, user_input: str, phone_number: str, context: str) -> str:
-        """Build the complete conversation prompt including context and history"""
-        prompt = context + "\n\n"
+    def _build_conversation_prompt(self, user_input: str, history: List[Dict], prefix: str) -> str:
+        """Build the complete conversation prompt from the context prefix and history"""
+        parts = [prefix]
         
         # Add recent conversation history (last 5 exchanges)
-        history = self.conversation_history.get(phone_number, [])
-        recent_history = history[-5:] if len(history) > 5 else history
+        for exchange in history[-5:]:
+            parts.append(f"المستخدم: {exchange['user']}\nالمساعد: {exchange['assistant']}\n\n")
         
-        for exchange in recent_history:
-            prompt += f"المستخدم: {exchange['user']}\n"
-            prompt += f"المساعد: {exchange['assistant']}\n\n"
+        parts.append(f"المستخدم: {user_input}\nالمساعد:")
         
-        prompt += f"المستخدم: {user_input}\nالمساعد:"
+        return "".join(parts)
+    
+    def _get_history(self, phone_number: str) -> List[Dict]:
+        """
+        Get a caller's history, creating it and evicting idle callers as needed
         
-        return prompt
+        Returns:
+            List[Dict]: Snapshot of the caller's exchanges, oldest first
+        """
+        now = time.monotonic()
+        with self._history_lock:
+            history = self.conversation_history.get(phone_number)
+            if history is None:
+                history = self.conversation_history[phone_number] = []
+            else:
+                self.conversation_history.move_to_end(phone_number)
+            self._history_seen[phone_number] = now
+            
+            # Least recently seen callers are at the front
+            cutoff = now - self.HISTORY_TTL
+            while len(self.conversation_history) > self.HISTORY_SIZE or (
+                    self._history_seen[next(iter(self.conversation_history))] < cutoff):
+                oldest, _ = self.conversation_history.popitem(last=False)
+                del self._history_seen[oldest]
+            
+            return list(history)
     
     def _update_conversation_history(self, phone_number: str, user_input: str, ai_response: str):
         """Update conversation history for the user"""
-        if phone_number not in self.conversation_history:
-            self.conversation_history[phone_number] = []
-        
-        self.conversation_history[phone_number].append({
-            "user": user_input,
-            "assistant": ai_response
-        })
-        
-        # Keep only last 10 exchanges to manage memory
-        if len(self.conversation_history[phone_number]) > 10:
-            self.conversation_history[phone_number] = self.conversation_history[phone_number][-10:]
+        with self._history_lock:
+            history = self.conversation_history.get(phone_number)
+            if history is None:
+                history = self.conversation_history[phone_number] = []
+                self._history_seen[phone_number] = time.monotonic()
+            
+            history.append({
+                "user": user_input,
+                "assistant": ai_response
+            })
+            
+            # Keep only last 10 exchanges to manage memory
+            if len(history) > 10:
+                del history[:-10]
     
     def clear_conversation(self, phone_number: str):
         """Clear conversation history for a user"""
-        if phone_number in self.conversation_history:
-            del self.conversation_history[phone_number]
+        with self._history_lock:
+            if self.conversation_history.pop(phone_number, None) is not None:
+                del self._history_seen[phone_number]
     
     def get_welcome_message(self, language: str = "arabic") -> str:
         """Get welcome message for new conversations"""
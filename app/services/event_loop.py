@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import threading
+from typing import Callable, Optional
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# One asyncio loop for the whole process, started on first use
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the shared background event loop
+    
+    Returns:
+        asyncio.AbstractEventLoop: Loop running forever on a daemon thread
+    """
+    global _loop
+    
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='event-loop', daemon=True).start()
+                _loop = loop
+                logger.info("Background event loop started")
+    
+    return _loop
+
+def call_later(delay: float, executor: Executor, fn: Callable, *args, **kwargs):
+    """
+    Run fn on executor after delay seconds, without a thread per wait
+    
+    The wait is a timer on the shared loop; fn itself goes to the executor
+    because the service SDKs it calls are blocking.
+    
+    Args:
+        delay (float): Seconds to wait
+        executor (Executor): Pool that runs fn
+        fn (Callable): Function to run
+    """
+    def submit():
+        executor.submit(fn, *args, **kwargs)
+    
+    loop = get_event_loop()
+    loop.call_soon_threadsafe(loop.call_later, delay, submit)
+
+class BoundedExecutor(ThreadPoolExecutor):
+    """
+    Thread pool whose try_submit refuses work once too much is queued
+    
+    ThreadPoolExecutor queues without limit, so a burst of transcription
+    results could pile up turns that are stale by the time they run.
+    submit() stays unbounded for work that must not be dropped.
+    """
+    
+    def __init__(self, max_workers: int, max_pending: int, thread_name_prefix: str = ''):
+        """
+        Args:
+            max_workers (int): Worker threads
+            max_pending (int): Jobs accepted by try_submit, running or queued
+            thread_name_prefix (str): Prefix for worker thread names
+        """
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._slots = threading.BoundedSemaphore(max_pending)
+    
+    def try_submit(self, fn: Callable, *args, **kwargs) -> Optional[Future]:
+        """
+        Submit fn unless max_pending jobs are already outstanding
+        
+        Returns:
+            Optional[Future]: The job's future, or None if it was refused
+        """
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"{self._thread_name_prefix} pool saturated, dropping {getattr(fn, '__name__', fn)}")
+            return None
+        
+        try:
+            future = self.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
@@ -1,8 +1,10 @@
 import asyncio
-import queue
+import functools
+import itertools
 import threading
 import time
-from typing import Optional, Generator, Callable
+from collections import deque
+from typing import Optional, Generator, Callable, Iterable
 from google.cloud import speech
 from google.api_core import exceptions as google_exceptions
 import io
@@ -10,51 +12,85 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Recognition settings never change, so the protobufs are built once and
+# shared; they are only read after construction
+RECOGNITION_CONFIG = speech.RecognitionConfig(
+    encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+    sample_rate_hertz=8000,  # Twilio's default sample rate
+    language_code="ar-SA",  # Arabic (Saudi Arabia) - best for Syrian dialect
+    alternative_language_codes=["ar", "en-US"],  # Fallback languages
+    enable_automatic_punctuation=True,
+    enable_word_confidence=True,
+    enable_word_time_offsets=True,
+    audio_channel_count=1,
+    enable_separate_recognition_per_channel=False,
+    model="latest_long",  # Best for longer audio segments
+    use_enhanced=True,  # Enhanced models for better accuracy
+)
+
+STREAMING_CONFIG = speech.StreamingRecognitionConfig(
+    config=RECOGNITION_CONFIG,
+    interim_results=True,  # Get partial results while speaking
+    single_utterance=False,  # Continue listening after silence
+)
+
+# Whole recordings only need the final transcript
+RECORDING_STREAMING_CONFIG = speech.StreamingRecognitionConfig(
+    config=RECOGNITION_CONFIG,
+    interim_results=False,
+)
+
+# Each live call holds a long-lived stream; spreading them over a few
+# channels keeps one HTTP/2 connection's concurrent-stream limit from
+# capping the number of calls
+SPEECH_CHANNEL_POOL_SIZE = 4
+
+def _create_pooled_channel(*args, options=(), **kwargs):
+    """gRPC channel with its own subchannel pool, so each gets its own connection"""
+    from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+    
+    options = [*options, ('grpc.use_local_subchannel_pool', 1)]
+    return SpeechGrpcTransport.create_channel(*args, options=options, **kwargs)
+
+@functools.lru_cache(maxsize=1)
+def _speech_client_pool() -> 'itertools.cycle':
+    """Process-wide Speech clients, created (auth + gRPC channels) on first use"""
+    from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+    
+    clients = [speech.SpeechClient(transport=SpeechGrpcTransport(channel=_create_pooled_channel))
+               for _ in range(SPEECH_CHANNEL_POOL_SIZE)]
+    logger.info(f"Google Speech-to-Text clients created ({len(clients)} channels)")
+    return itertools.cycle(clients)
+
+def _speech_client() -> speech.SpeechClient:
+    """Next Speech client from the pool, round robin"""
+    return next(_speech_client_pool())
+
 class GoogleSpeechService:
     """Real-time Google Speech-to-Text service with streaming capabilities"""
     
     def __init__(self, credentials_path: Optional[str] = None, project_id: Optional[str] = None):
         """
-        Initialize Google Speech-to-Text client
+        Configure Google Speech-to-Text; the client itself is created on first use
         
         Args:
             credentials_path: Path to Google Cloud service account JSON file
             project_id: Google Cloud project ID
         """
-        try:
-            if credentials_path:
-                import os
-                os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
-            
-            self.client = speech.SpeechClient()
-            self.project_id = project_id
-            
-            # Streaming configuration
-            self.config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-                sample_rate_hertz=8000,  # Twilio's default sample rate
-                language_code="ar-SA",  # Arabic (Saudi Arabia) - best for Syrian dialect
-                alternative_language_codes=["ar", "en-US"],  # Fallback languages
-                enable_automatic_punctuation=True,
-                enable_word_confidence=True,
-                enable_word_time_offsets=True,
-                audio_channel_count=1,
-                enable_separate_recognition_per_channel=False,
-                model="latest_long",  # Best for longer audio segments
-                use_enhanced=True,  # Enhanced models for better accuracy
-            )
-            
-            self.streaming_config = speech.StreamingRecognitionConfig(
-                config=self.config,
-                interim_results=True,  # Get partial results while speaking
-                single_utterance=False,  # Continue listening after silence
-            )
-            
-            logger.info("Google Speech-to-Text service initialized successfully")
-            
-        except Exception as e:
-            logger.error(f"Failed to initialize Google Speech service: {e}")
-            raise
+        if credentials_path:
+            import os
+            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
+        
+        self.project_id = project_id
+        self.config = RECOGNITION_CONFIG
+        self.streaming_config = STREAMING_CONFIG
+        self.recording_streaming_config = RECORDING_STREAMING_CONFIG
+        
+        logger.info("Google Speech-to-Text service initialized successfully")
+    
+    @property
+    def client(self) -> speech.SpeechClient:
+        return _speech_client()
     
     def transcribe_audio_file(self, audio_file_path: str) -> Optional[str]:
         """
@@ -122,10 +158,72 @@ class GoogleSpeechService:
             logger.error(f"Error transcribing audio bytes: {e}")
             return None
     
+    def transcribe_audio_uri(self, uri: str) -> Optional[str]:
+        """
+        Transcribe audio that Google can read directly (gs:// URI)
+        
+        The audio is fetched by Google, so it never passes through this server.
+        
+        Args:
+            uri: Cloud Storage URI of LINEAR16 8kHz audio (under one minute)
+            
+        Returns:
+            Transcribed text or None if failed
+        """
+        try:
+            audio = speech.RecognitionAudio(uri=uri)
+            response = self.client.recognize(config=self.config, audio=audio)
+            
+            transcripts = [result.alternatives[0].transcript.strip()
+                           for result in response.results if result.alternatives]
+            return ' '.join(transcripts) or None
+            
+        except google_exceptions.GoogleAPIError as e:
+            logger.error(f"Google API error during transcription: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Error transcribing audio URI: {e}")
+            return None
+    
+    def transcribe_audio_stream(self, audio_chunks: Iterable[bytes]) -> Optional[str]:
+        """
+        Transcribe LINEAR16 audio while it is still arriving
+        
+        Chunks are forwarded to streaming recognition as they are produced,
+        so recognition overlaps the download and the full recording is
+        never held in memory.
+        
+        Args:
+            audio_chunks: Raw LINEAR16 audio chunks (each under 25 KB)
+            
+        Returns:
+            Transcribed text or None if failed
+        """
+        try:
+            # The client helper sends the config request ahead of the audio
+            requests = (speech.StreamingRecognizeRequest(audio_content=chunk)
+                        for chunk in audio_chunks if chunk)
+            
+            transcripts = []
+            for response in self.client.streaming_recognize(self.recording_streaming_config, requests):
+                for result in response.results:
+                    if result.is_final and result.alternatives:
+                        transcripts.append(result.alternatives[0].transcript.strip())
+            
+            return ' '.join(transcripts) or None
+            
+        except google_exceptions.GoogleAPIError as e:
+            logger.error(f"Google API error during transcription: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Error transcribing audio stream: {e}")
+            return None
+    
     def create_streaming_session(self, 
                                 on_interim_result: Optional[Callable[[str], None]] = None,
                                 on_final_result: Optional[Callable[[str, float], None]] = None,
-                                on_error: Optional[Callable[[Exception], None]] = None) -> 'StreamingSession':
+                                on_error: Optional[Callable[[Exception], None]] = None,
+                                on_overrun: Optional[Callable[[int], None]] = None) -> 'StreamingSession':
         """
         Create a new streaming recognition session
         
@@ -133,6 +231,7 @@ class GoogleSpeechService:
             on_interim_result: Callback for partial results
             on_final_result: Callback for final results (text, confidence)
             on_error: Callback for errors
+            on_overrun: Callback when audio is dropped (total dropped chunks)
             
         Returns:
             StreamingSession object
@@ -142,30 +241,46 @@ class GoogleSpeechService:
             self.streaming_config,
             on_interim_result,
             on_final_result,
-            on_error
+            on_error,
+            on_overrun
         )
 
 
 class StreamingSession:
     """Handles a single streaming recognition session"""
     
+    # Audio is sent to Google in ~200ms requests (16-bit 8kHz) rather than
+    # one request per chunk handed to add_audio_data
+    CHUNK_BYTES = int(8000 * 2 * 0.2)
+    CHUNK_SECONDS = 0.2
+    
+    # Chunks held while the stream to Google stalls (~10s of the 100ms
+    # batches the media route sends); further audio is dropped
+    MAX_PENDING_CHUNKS = 100
+    
     def __init__(self, 
                  client: speech.SpeechClient,
                  streaming_config: speech.StreamingRecognitionConfig,
                  on_interim_result: Optional[Callable[[str], None]] = None,
                  on_final_result: Optional[Callable[[str, float], None]] = None,
-                 on_error: Optional[Callable[[Exception], None]] = None):
+                 on_error: Optional[Callable[[Exception], None]] = None,
+                 on_overrun: Optional[Callable[[int], None]] = None):
         
         self.client = client
         self.streaming_config = streaming_config
         self.on_interim_result = on_interim_result
         self.on_final_result = on_final_result
         self.on_error = on_error
+        self.on_overrun = on_overrun
         
-        self.audio_queue = queue.Queue()
+        # Audio waiting to be sent; _new_audio wakes the recognition thread
+        # as soon as a chunk arrives instead of polling the buffer
+        self._buf = deque()
+        self._new_audio = threading.Event()
+        self.dropped_frames = 0
         self.closed = False
         self.session_timeout = 300  # 5 minutes timeout
-        self.last_audio_time = time.time()
+        self._deadline = time.monotonic() + self.session_timeout  # pushed back by new audio
         
         # Threading
         self.recognition_thread = None
@@ -178,7 +293,7 @@ class StreamingSession:
         
         self.session_active = True
         self.closed = False
-        self.last_audio_time = time.time()
+        self._deadline = time.monotonic() + self.session_timeout
         
         # Start recognition in separate thread
         self.recognition_thread = threading.Thread(target=self._recognition_loop)
@@ -197,20 +312,27 @@ class StreamingSession:
         if not self.session_active or self.closed:
             return
         
-        self.last_audio_time = time.time()
+        self._deadline = time.monotonic() + self.session_timeout
         
-        try:
-            self.audio_queue.put(audio_data, timeout=1.0)
-        except queue.Full:
-            logger.warning("Audio queue is full, dropping audio data")
+        if len(self._buf) >= self.MAX_PENDING_CHUNKS:
+            # Recognition has stalled; drop instead of growing without bound
+            self.dropped_frames += 1
+            if self.dropped_frames == 1:
+                logger.warning("Audio buffer is full, dropping audio data")
+            if self.on_overrun:
+                self.on_overrun(self.dropped_frames)
+            return
+        
+        self._buf.append(audio_data)
+        self._new_audio.set()
     
     def stop(self):
         """Stop the streaming session"""
         self.session_active = False
         self.closed = True
         
-        # Signal end of audio stream
-        self.audio_queue.put(None)
+        # Wake the audio generator; it sends what is buffered, then ends
+        self._new_audio.set()
         
         # Wait for recognition thread to finish
         if self.recognition_thread and self.recognition_thread.is_alive():
@@ -219,45 +341,59 @@ class StreamingSession:
         logger.info("Streaming recognition session stopped")
     
     def _audio_generator(self):
-        """Generator that yields audio data from the queue"""
+        """Generator that yields audio data in ~200ms requests as it is added"""
+        buf = self._buf
+        pending = bytearray()
+        flush_at = None  # when the oldest pending audio must be sent
         while not self.closed:
             try:
-                # Check for session timeout
-                if time.time() - self.last_audio_time > self.session_timeout:
+                # Sleep until new audio arrives, pending audio is due or the
+                # session would time out
+                now = time.monotonic()
+                if now >= self._deadline:
                     logger.info("Session timeout reached")
                     break
                 
-                chunk = self.audio_queue.get(timeout=1.0)
-                if chunk is None:  # End of stream signal
-                    break
+                wake_at = self._deadline if flush_at is None else min(self._deadline, flush_at)
+                self._new_audio.wait(timeout=max(wake_at - now, 0.0))
+                self._new_audio.clear()
                 
-                yield speech.StreamingRecognizeRequest(audio_content=chunk)
+                # Clearing before draining means a chunk appended meanwhile
+                # either is drained here or sets the event again
+                while buf:
+                    pending += buf.popleft()
+                
+                if not pending:
+                    continue
+                if flush_at is None:
+                    flush_at = time.monotonic() + self.CHUNK_SECONDS
+                
+                if len(pending) >= self.CHUNK_BYTES or time.monotonic() >= flush_at:
+                    yield speech.StreamingRecognizeRequest(audio_content=bytes(pending))
+                    pending.clear()
+                    flush_at = None
                 
-            except queue.Empty:
-                continue
             except Exception as e:
                 logger.error(f"Error in audio generator: {e}")
                 break
+        
+        # Audio added right before stop() still goes out with the partly
+        # filled request, so the caller's last words are recognized
+        while buf:
+            pending += buf.popleft()
+        if pending:
+            yield speech.StreamingRecognizeRequest(audio_content=bytes(pending))
     
     def _recognition_loop(self):
         """Main recognition loop running in separate thread"""
         try:
-            # Create the initial request with config
-            requests = [speech.StreamingRecognizeRequest(
-                streaming_config=self.streaming_config
-            )]
+            # Start streaming recognition; the client sends the config request
+            # first and then pulls audio from the generator as it arrives
+            responses = self.client.streaming_recognize(self.streaming_config, self._audio_generator())
             
-            # Add audio data requests
-            requests.extend(self._audio_generator())
-            
-            # Start streaming recognition
-            responses = self.client.streaming_recognize(requests)
-            
-            # Process responses
+            # Process responses; after stop() the stream ends once Google has
+            # answered the audio sent before it
             for response in responses:
-                if self.closed:
-                    break
-                
                 if response.error.code != 0:
                     error_msg = f"Speech recognition error: {response.error.message}"
                     logger.error(error_msg)
@@ -269,19 +405,19 @@ class StreamingSession:
                     if not result.alternatives:
                         continue
                     
-                    transcript = result.alternatives[0].transcript
+                    transcript = result.alternatives[0].transcript.strip()
                     confidence = result.alternatives[0].confidence
                     
                     if result.is_final:
                         # Final result
                         if self.on_final_result:
-                            self.on_final_result(transcript.strip(), confidence)
-                        logger.info(f"Final: '{transcript.strip()}' (confidence: {confidence:.2f})")
+                            self.on_final_result(transcript, confidence)
+                        logger.info("Final: '%s' (confidence: %.2f)", transcript, confidence)
                     else:
                         # Interim result
                         if self.on_interim_result:
-                            self.on_interim_result(transcript.strip())
-                        logger.debug(f"Interim: '{transcript.strip()}'")
+                            self.on_interim_result(transcript)
+                        logger.debug("Interim: '%s'", transcript)
         
         except google_exceptions.GoogleAPIError as e:
             error_msg = f"Google API error in recognition loop: {e}"
@@ -1,13 +1,21 @@
 import requests
-import tempfile
-import os
+from requests.adapters import HTTPAdapter
 from app.config import Config
 from app.services.google_speech_service import initialize_google_speech_service, get_google_speech_service
-from typing import Optional, Tuple
+from typing import Optional, Iterator
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Kept below the 25 KB per-request limit of streaming recognition
+DOWNLOAD_CHUNK_SIZE = 16 * 1024
+
+# Shared keep-alive session so recording downloads reuse TLS connections
+http_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64)
+http_session.mount('https://', _adapter)
+http_session.mount('http://', _adapter)
+
 class SpeechService:
     """Service for handling speech-to-text and text-to-speech operations"""
     
@@ -31,7 +39,7 @@ class SpeechService:
         Using Google Speech-to-Text API
         
         Args:
-            audio_url (str): URL to audio file
+            audio_url (str): URL to audio file; gs:// URIs are passed to Google as is
             
         Returns:
             Optional[str]: Transcribed text or None if failed
@@ -41,55 +49,47 @@ class SpeechService:
                 logger.error("Google Speech service not initialized")
                 return None
             
-            # Download audio file
-            audio_data = self._download_audio(audio_url)
-            if not audio_data:
-                return None
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
-            
-            try:
-                # Use Google Speech-to-Text API for transcription
-                transcription = self._transcribe_with_google_speech(temp_file_path)
-                return transcription
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
+            # Google reads Cloud Storage itself; no need to relay the audio
+            if audio_url.startswith('gs://'):
+                return self.google_speech.transcribe_audio_uri(audio_url)
+            
+            # Stream the recording straight into recognition
+            response = http_session.get(audio_url, stream=True, timeout=30)
+            with response:
+                if response.status_code != 200:
+                    logger.error(f"Failed to download audio: HTTP {response.status_code}")
+                    return None
+                
+                return self.google_speech.transcribe_audio_stream(self._iter_pcm_chunks(response))
                     
         except Exception as e:
             logger.error(f"Error transcribing audio: {str(e)}")
             return None
     
-    def _download_audio(self, audio_url: str) -> Optional[bytes]:
-        """Download audio file from URL"""
-        try:
-            response = requests.get(audio_url, timeout=30)
-            if response.status_code == 200:
-                return response.content
-            logger.error(f"Failed to download audio: HTTP {response.status_code}")
-            return None
-        except Exception as e:
-            logger.error(f"Error downloading audio: {str(e)}")
-            return None
-    
-    def _transcribe_with_google_speech(self, audio_file_path: str) -> Optional[str]:
+    def _iter_pcm_chunks(self, response) -> Iterator[bytes]:
         """
-        Transcribe audio using Google Speech-to-Text API
+        Yield the PCM payload of a streamed WAV recording
+        
+        Twilio serves recordings as 16-bit 8kHz WAV; the RIFF header is
+        dropped so only LINEAR16 samples reach the recognizer.
         """
-        try:
-            if not self.google_speech:
-                logger.error("Google Speech service not initialized")
-                return None
-            
-            return self.google_speech.transcribe_audio_file(audio_file_path)
-            
-        except Exception as e:
-            logger.error(f"Error with Google Speech transcription: {str(e)}")
-            return None
+        header = b''
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if header is not None:
+                header += chunk
+                if not header.startswith(b'RIFF'):
+                    if len(header) < 4:
+                        continue
+                    # Not a WAV file, pass the bytes through untouched
+                    chunk, header = header, None
+                else:
+                    data_index = header.find(b'data')
+                    if data_index < 0 or len(header) < data_index + 8:
+                        continue
+                    chunk, header = header[data_index + 8:], None
+            
+            if chunk:
+                yield chunk
     
     def detect_speech_end(self, silence_duration: int = 2) -> bool:
         """
@@ -105,37 +105,6 @@ class SpeechService:
         # For now, return True as placeholder
         return True
     
-    def generate_speech_response(self, text: str, gender: str = 'female') -> Tuple[Optional[str], int]:
-        """
-        Generate speech response using ElevenLabs
-        
-        Args:
-            text (str): Text to convert to speech
-            gender (str): Voice gender preference
-            
-        Returns:
-            Tuple[Optional[str], int]: (file_path, status_code)
-        """
-        from app.services.voice_service import generate_arabic_voice, cleanup_temp_file
-        
-        try:
-            # Generate audio using existing voice service
-            audio_generator = generate_arabic_voice(text, gender)
-            
-            # Create temporary file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-            
-            # Write audio data
-            for chunk in audio_generator:
-                temp_file.write(chunk)
-            
-            temp_file.close()
-            return temp_file.name, 200
-            
-        except Exception as e:
-            print(f"Error generating speech: {str(e)}")
-            return None, 500
-
     def transcribe_audio_bytes(self, audio_bytes: bytes) -> Optional[str]:
         """
         Transcribe audio bytes directly using Google Speech-to-Text API
@@ -162,7 +131,8 @@ class SpeechService:
     def create_streaming_session(self, 
                                 on_interim_result=None,
                                 on_final_result=None,
-                                on_error=None):
+                                on_error=None,
+                                on_overrun=None):
         """
         Create a new real-time streaming session for continuous transcription
         
@@ -170,6 +140,7 @@ class SpeechService:
             on_interim_result: Callback for partial results
             on_final_result: Callback for final results (text, confidence)
             on_error: Callback for errors
+            on_overrun: Callback when audio is dropped (total dropped chunks)
             
         Returns:
             StreamingSession object or None if service not available
@@ -182,7 +153,8 @@ class SpeechService:
             return self.google_speech.create_streaming_session(
                 on_interim_result=on_interim_result,
                 on_final_result=on_final_result,
-                on_error=on_error
+                on_error=on_error,
+                on_overrun=on_overrun
             )
             
         except Exception as e:
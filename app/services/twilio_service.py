@@ -1,8 +1,51 @@
 from twilio.twiml.voice_response import VoiceResponse, Gather, Say, Record, Play
-from twilio.rest import Client
 from app.config import Config
 from typing import Optional, Dict, Any
+from functools import cached_property, lru_cache
+from xml.sax.saxutils import escape, quoteattr
 import os
+import re
+
+# TwiML templates for responses whose structure never changes; only the
+# escaped text (and the record callback URL) are substituted in
+_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+_SAY_TEMPLATE = '<Say language="ar" voice="Polly.Zeina">{message}</Say>'
+_CONVERSATION_TEMPLATE = (
+    _XML_DECLARATION
+    + '<Response>'
+    + _SAY_TEMPLATE
+    + '<Record action={action} finishOnKey="#" maxLength="30" method="POST" '
+      'playBeep="false" timeout="3" transcribe="false" />'
+    + '</Response>'
+)
+_SAY_AND_HANGUP_TEMPLATE = (
+    _XML_DECLARATION
+    + '<Response>'
+    + _SAY_TEMPLATE
+    + '<Hangup />'
+    + '</Response>'
+)
+
+# Phrases that end the conversation, matched case-insensitively anywhere
+# in the input in a single pass
+END_PHRASES = (
+    'مع السلامة', 'باي', 'شكراً', 'خلاص', 'يعطيك العافية',
+    'goodbye', 'bye', 'thank you', 'thanks', 'end call'
+)
+_END_PHRASE_PATTERN = re.compile('|'.join(map(re.escape, END_PHRASES)), re.IGNORECASE)
+
+@lru_cache(maxsize=512)
+def _escape_text(text: str) -> str:
+    """XML-escape spoken text; repeated replies hit the cache"""
+    return escape(text)
+
+# Fixed prompts are serialized once at import
+WELCOME_PROMPT = "أهلاً وسهلاً! أنا مساعدك الذكي. كيف بدك أساعدك اليوم؟"
+DEFAULT_ERROR_MESSAGE = "عذراً، حدث خطأ تقني. يرجى المحاولة مرة أخرى لاحقاً."
+_GOODBYE_XML = _SAY_AND_HANGUP_TEMPLATE.format(
+    message=_escape_text("شكراً لك على الاتصال. مع السلامة!"))
+_TIMEOUT_XML = _SAY_AND_HANGUP_TEMPLATE.format(
+    message=_escape_text("لم أسمع رد منك. شكراً لك على الاتصال. مع السلامة!"))
 
 class TwilioService:
     """Service for handling Twilio voice interactions and TwiML responses"""
@@ -10,10 +53,24 @@ class TwilioService:
     def __init__(self):
         self.account_sid = Config.TWILIO_ACCOUNT_SID
         self.auth_token = Config.TWILIO_AUTH_TOKEN
-        self.client = Client(self.account_sid, self.auth_token) if self.account_sid and self.auth_token else None
         
         # Base URL for your Flask app (you'll need to set this)
         self.base_url = os.getenv('FLASK_BASE_URL', 'https://your-ngrok-url.ngrok.io')
+        self._record_action = quoteattr(f'{self.base_url}/voice/process')
+        
+        # Serialized TwiML for responses that only depend on static inputs
+        self._welcome_response = self.create_conversation_response(WELCOME_PROMPT, None)
+        self._stream_responses: Dict[str, str] = {}
+        self._error_responses: Dict[str, str] = {}
+    
+    @cached_property
+    def client(self):
+        """Twilio REST client, built on first use; webhooks never need it"""
+        if not (self.account_sid and self.auth_token):
+            return None
+        
+        from twilio.rest import Client
+        return Client(self.account_sid, self.auth_token)
     
     def create_welcome_response(self, phone_number: str) -> str:
         """
@@ -25,35 +82,7 @@ class TwilioService:
         Returns:
             str: TwiML XML response
         """
-        response = VoiceResponse()
-        
-        # Welcome message using ElevenLabs-generated Arabic
-        response.say(
-            "أهلاً وسهلاً! أنا مساعدك الذكي. كيف بدك أساعدك اليوم؟",
-            voice='Polly.Zeina',  # Arabic voice
-            language='ar'
-        )
-        
-        # Record user's response and process it
-        response.record(
-            action=f'{self.base_url}/voice/process',
-            method='POST',
-            max_length=30,  # Maximum 30 seconds per recording
-            finish_on_key='#',  # User can press # to finish
-            play_beep=False,
-            timeout=3,  # Stop recording after 3 seconds of silence
-            transcribe=False  # We'll use Whisper instead
-        )
-        
-        return str(response)
-        response.say(
-            "لم أسمع أي رد. يرجى المحاولة مرة أخرى.",
-            voice='Polly.Zeina',
-            language='ar'
-        )
-        response.hangup()
-        
-        return str(response)
+        return self._welcome_response
     
     def create_conversation_response(self, ai_response: str, phone_number: str) -> str:
         """
@@ -66,28 +95,10 @@ class TwilioService:
         Returns:
             str: TwiML XML response
         """
-        response = VoiceResponse()
-        
-        # Speak the AI response
-        response.say(
-            ai_response,
-            voice='Polly.Zeina',
-            language='ar'
-        )
-        
-        # Record user's next response
-        response.record(
-            action=f'{self.base_url}/voice/process',
-            method='POST',
-            max_length=30,  # Maximum 30 seconds per recording
-            finish_on_key='#',  # User can press # to finish
-            play_beep=False,
-            timeout=3,  # Stop recording after 3 seconds of silence
-            transcribe=False  # We'll use Whisper instead
+        return _CONVERSATION_TEMPLATE.format(
+            message=_escape_text(ai_response),
+            action=self._record_action
         )
-        
-        return str(response)
-        return str(response)
     
     def create_goodbye_response(self) -> str:
         """
@@ -96,37 +107,51 @@ class TwilioService:
         Returns:
             str: TwiML XML response
         """
-        response = VoiceResponse()
-        response.say(
-            "شكراً لك على الاتصال. مع السلامة!",
-            voice='Polly.Zeina',
-            language='ar'
-        )
-        response.hangup()
-        return str(response)
+        return _GOODBYE_XML
+    
+    def create_stream_response(self, websocket_url: str) -> str:
+        """
+        Create TwiML response that connects the call to a media stream
+        
+        The document only depends on the WebSocket URL, so it is built once
+        per URL and reused for every incoming call.
+        
+        Args:
+            websocket_url (str): wss:// URL of the media stream endpoint
+            
+        Returns:
+            str: TwiML XML response
+        """
+        twiml = self._stream_responses.get(websocket_url)
+        if twiml is None:
+            response = VoiceResponse()
+            connect = response.connect()
+            connect.stream(url=websocket_url)
+            twiml = str(response)
+            self._stream_responses[websocket_url] = twiml
+        return twiml
     
     def create_error_response(self, error_message: str = None) -> str:
         """
         Create TwiML response for errors
         
+        Error messages come from a small set of constants, so the serialized
+        TwiML is cached per message.
+        
         Args:
             error_message (str): Custom error message
             
         Returns:
             str: TwiML XML response
         """
-        response = VoiceResponse()
+        message = error_message or DEFAULT_ERROR_MESSAGE
         
-        message = error_message or "عذراً، حدث خطأ تقني. يرجى المحاولة مرة أخرى لاحقاً."
+        twiml = self._error_responses.get(message)
+        if twiml is None:
+            twiml = _SAY_AND_HANGUP_TEMPLATE.format(message=_escape_text(message))
+            self._error_responses[message] = twiml
         
-        response.say(
-            message,
-            voice='Polly.Zeina',
-            language='ar'
-        )
-        response.hangup()
-        
-        return str(response)
+        return twiml
     
     def create_timeout_response(self) -> str:
         """
@@ -135,14 +160,7 @@ class TwilioService:
         Returns:
             str: TwiML XML response
         """
-        response = VoiceResponse()
-        response.say(
-            "لم أسمع رد منك. شكراً لك على الاتصال. مع السلامة!",
-            voice='Polly.Zeina',
-            language='ar'
-        )
-        response.hangup()
-        return str(response)
+        return _TIMEOUT_XML
     
     def detect_conversation_end(self, user_input: str) -> bool:
         """
@@ -154,13 +172,7 @@ class TwilioService:
         Returns:
             bool: True if conversation should end
         """
-        end_phrases = [
-            'مع السلامة', 'باي', 'شكراً', 'خلاص', 'يعطيك العافية',
-            'goodbye', 'bye', 'thank you', 'thanks', 'end call'
-        ]
-        
-        user_input_lower = user_input.lower()
-        return any(phrase in user_input_lower for phrase in end_phrases)
+        return _END_PHRASE_PATTERN.search(user_input) is not None
     
     def get_call_details(self, call_sid: str) -> Optional[Dict[str, Any]]:
         """
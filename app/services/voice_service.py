@@ -1,17 +1,24 @@
 from elevenlabs.client import ElevenLabs
+import httpx
 from app.config import Config
+import hashlib
 import os
+import subprocess
 import tempfile
-import io
-import audioop
-import wave
-import struct
-from pydub import AudioSegment
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize ElevenLabs client
+logger = logging.getLogger(__name__)
+
+# Initialize ElevenLabs client on a keep-alive pool sized for concurrent calls
 client = ElevenLabs(
-    api_key=Config.ELEVENLABS_API_KEY
+    api_key=Config.ELEVENLABS_API_KEY,
+    httpx_client=httpx.Client(
+        timeout=60,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    )
 ) if Config.ELEVENLABS_API_KEY else None
 
 # Arabic Syrian voice options
@@ -20,7 +27,148 @@ ARABIC_VOICES = {
     'female': 'EXAVITQu4vr4xnSDxMaL'     # Bella (good for Arabic)
 }
 
-def generate_arabic_voice(text, gender='male', model="eleven_multilingual_v2"):
+# One second of µ-law silence (0xFF) in 160-byte frames, sent when synthesis fails
+_MULAW_SILENCE_1S = b'\xff' * 8000
+_MULAW_SILENCE_FRAMES = tuple(_MULAW_SILENCE_1S[i:i + 160] for i in range(0, 8000, 160))
+
+# µ-law chunks of fixed phrases (welcome, goodbye) keyed by (text, voice_id, model);
+# with TTS_CACHE_DIR set, every kept phrase is also written to disk
+_TTS_CACHE = {}
+
+# Replies synthesized a second time (cached openings, "تمام", ...) are kept
+# as well, least recently used first out; _TTS_SEEN remembers recent first
+# requests so one-off replies are never stored
+TTS_REPLY_CACHE_SIZE = 128
+_TTS_REPLIES = OrderedDict()
+_TTS_SEEN = OrderedDict()
+_tts_lock = threading.Lock()
+
+# Identical texts requested while one is being synthesized share that run.
+# Runs stream from ElevenLabs on their own workers, so a slow caller never
+# holds one of the capped ElevenLabs streams open
+MAX_CONCURRENT_SYNTHESIS = 32
+_TTS_INFLIGHT = {}
+_TTS_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SYNTHESIS, thread_name_prefix='tts')
+
+class _InflightSynthesis:
+    """Frames of a synthesis in progress, replayed to identical requests as they arrive"""
+    
+    __slots__ = ('frames', 'keep', 'done', 'complete', 'cond')
+    
+    def __init__(self, keep):
+        self.frames = []
+        self.keep = keep  # set by a sharing request, which makes the text a repeat
+        self.done = False
+        self.complete = False  # ElevenLabs reached the end of the reply
+        self.cond = threading.Condition()
+    
+    def append(self, frame):
+        with self.cond:
+            self.frames.append(frame)
+            self.cond.notify_all()
+    
+    def finish(self, complete):
+        with self.cond:
+            self.done = True
+            self.complete = complete
+            self.cond.notify_all()
+    
+    def __iter__(self):
+        sent = 0
+        while True:
+            with self.cond:
+                while sent == len(self.frames) and not self.done:
+                    self.cond.wait()
+                new_frames = self.frames[sent:]
+                if not new_frames:
+                    return
+            sent += len(new_frames)
+            yield from new_frames
+
+def _get_cached_frames(cache_key):
+    """Cached frames for a phrase or repeated reply, or None"""
+    frames = _TTS_CACHE.get(cache_key)
+    if frames is not None:
+        return frames
+    
+    with _tts_lock:
+        frames = _TTS_REPLIES.get(cache_key)
+        if frames is not None:
+            _TTS_REPLIES.move_to_end(cache_key)
+        return frames
+
+def is_voice_cached(text, gender='male', model="eleven_multilingual_v2") -> bool:
+    """True if a complete synthesis of text is cached; failed runs never are"""
+    voice_id = ARABIC_VOICES.get(gender, ARABIC_VOICES['female'])
+    return _get_cached_frames((text, voice_id, model)) is not None
+
+def _seen_before(cache_key) -> bool:
+    """Record a synthesis request; True if the same text was requested recently"""
+    with _tts_lock:
+        if cache_key in _TTS_SEEN:
+            del _TTS_SEEN[cache_key]
+            return True
+        _TTS_SEEN[cache_key] = None
+        while len(_TTS_SEEN) > TTS_REPLY_CACHE_SIZE * 4:
+            _TTS_SEEN.popitem(last=False)
+        return False
+
+def _store_frames(cache_key, frames, pinned):
+    """Keep a complete reply's frames; pinned phrases are never evicted"""
+    if pinned:
+        _TTS_CACHE[cache_key] = frames
+        return
+    
+    with _tts_lock:
+        _TTS_REPLIES[cache_key] = frames
+        while len(_TTS_REPLIES) > TTS_REPLY_CACHE_SIZE:
+            _TTS_REPLIES.popitem(last=False)
+
+def _disk_cache_path(cache_key):
+    """File for a phrase in TTS_CACHE_DIR, addressed by a hash of its inputs"""
+    text, voice_id, model = cache_key
+    digest = hashlib.sha256(f"{voice_id}|{model}|ulaw_8000|{text.strip()}".encode('utf-8')).hexdigest()
+    return os.path.join(Config.TTS_CACHE_DIR, f"{digest}.ulaw")
+
+def _load_disk_frames(cache_key):
+    """Frames of a phrase synthesized by any worker before, or None"""
+    if not Config.TTS_CACHE_DIR:
+        return None
+    
+    path = _disk_cache_path(cache_key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.utime(path)  # Mark as recently used for eviction
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Could not read TTS cache file {path}: {e}")
+        return None
+    
+    return [data[i:i + 160] for i in range(0, len(data), 160)]
+
+def _save_disk_frames(cache_key, frames):
+    """Write a phrase to TTS_CACHE_DIR atomically and evict the oldest files"""
+    if not Config.TTS_CACHE_DIR:
+        return
+    
+    try:
+        os.makedirs(Config.TTS_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=Config.TTS_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b''.join(frames))
+        os.replace(tmp_path, _disk_cache_path(cache_key))
+        
+        entries = [entry for entry in os.scandir(Config.TTS_CACHE_DIR) if entry.name.endswith('.ulaw')]
+        if len(entries) > Config.TTS_DISK_CACHE_SIZE:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - Config.TTS_DISK_CACHE_SIZE]:
+                os.unlink(entry.path)
+    except OSError as e:
+        logger.warning(f"Could not write TTS cache: {e}")
+
+def generate_arabic_voice(text, gender='male', model="eleven_multilingual_v2", cache=False):
     """
     Generate Arabic voice audio using ElevenLabs and convert for Twilio
     
@@ -28,143 +176,155 @@ def generate_arabic_voice(text, gender='male', model="eleven_multilingual_v2"):
         text (str): Text to convert to speech
         gender (str): 'male' or 'female' voice option
         model (str): ElevenLabs model to use
+        cache (bool): Keep the audio permanently; use for fixed phrases only.
+            Other texts are kept in a bounded cache once requested twice
     
     Returns:
         generator: Audio chunks in µ-law format for Twilio
     """
-    logger = logging.getLogger(__name__)
-    
     if not client:
         raise Exception("ElevenLabs API key not configured")
     
     voice_id = ARABIC_VOICES.get(gender, ARABIC_VOICES['female'])
     
+    cache_key = (text, voice_id, model)
+    cached = _get_cached_frames(cache_key)
+    if cached is None:
+        cached = _load_disk_frames(cache_key)
+        if cached is not None:
+            _store_frames(cache_key, cached, pinned=cache)
+    if cached is not None:
+        yield from cached
+        return
+    keep = cache or _seen_before(cache_key)
+    
+    with _tts_lock:
+        inflight = _TTS_INFLIGHT.get(cache_key)
+        if inflight is None:
+            inflight = _TTS_INFLIGHT[cache_key] = _InflightSynthesis(keep)
+            leader = True
+        else:
+            inflight.keep = True
+            leader = False
+    
+    if leader:
+        _TTS_EXECUTOR.submit(_run_synthesis, text, voice_id, model, cache, inflight)
+    else:
+        logger.info("Sharing in-flight voice for text: '%.50s...'", text)
+    
+    frames_sent = 0
+    for chunk in inflight:
+        frames_sent += 1
+        yield chunk
+    
+    if frames_sent == 0 and not inflight.complete:
+        if not leader:
+            # The shared run failed before producing audio; try on our own
+            yield from generate_arabic_voice(text, gender, model, cache)
+            return
+        
+        # Fallback: 1 second of silence
+        logger.info("Generating fallback silence due to error")
+        yield from _MULAW_SILENCE_FRAMES
+
+def _run_synthesis(text, voice_id, model, cache, inflight):
+    """Worker: synthesize into the shared run, then mark it finished"""
+    complete = False
+    try:
+        complete = _synthesize(text, voice_id, model, cache, inflight)
+    finally:
+        with _tts_lock:
+            del _TTS_INFLIGHT[(text, voice_id, model)]
+        inflight.finish(complete)
+
+def _synthesize(text, voice_id, model, cache, inflight):
+    """
+    Stream a reply from ElevenLabs as Twilio frames, trying each output format
+    
+    Args:
+        text (str): Text to convert to speech
+        voice_id (str): ElevenLabs voice
+        model (str): ElevenLabs model to use
+        cache (bool): Pin the complete reply in the TTS cache
+        inflight (_InflightSynthesis): Receives the frames; keep says whether to cache
+    
+    Returns:
+        bool: True if the whole reply was received; only then is it cached
+    """
+    cache_key = (text, voice_id, model)
+    
+    # Chunks of a complete reply, stored in the cache when requested
+    frames = []
+    
     try:
-        logger.info(f"Generating voice for text: '{text[:50]}...' using voice {voice_id}")
+        logger.info("Generating voice for text: '%.50s...' using voice %s", text, voice_id)
         
-        # Try PCM format first (doesn't require ffmpeg), fallback to MP3
-        try:
-            # Generate audio from ElevenLabs in PCM format
-            audio_generator = client.text_to_speech.convert(
-                text=text,
-                voice_id=voice_id,
-                model_id=model,
-                output_format="pcm_22050"  # PCM format, easier to process
-            )
-            
-            # Collect all audio data
-            audio_data = b''
-            chunk_count = 0
-            for chunk in audio_generator:
-                audio_data += chunk
-                chunk_count += 1
-            
-            logger.info(f"Received {len(audio_data)} bytes of PCM audio data in {chunk_count} chunks from ElevenLabs")
-            
-            if len(audio_data) == 0:
-                raise Exception("No audio data received from ElevenLabs")
-            
-            # Convert PCM to proper format for Twilio
-            converted_chunks = list(convert_pcm_for_twilio(audio_data, 22050))
-            logger.info(f"Converted to {len(converted_chunks)} µ-law chunks for Twilio")
-            
-            # Return as generator
-            for chunk in converted_chunks:
-                yield chunk
+        # Try each output format until one produces audio; the first frames
+        # reach the caller before synthesis has finished
+        for output_format, to_frames in _TTS_FORMATS:
+            frames_sent = 0
+            try:
+                audio_generator = client.text_to_speech.convert_as_stream(
+                    text=text,
+                    voice_id=voice_id,
+                    model_id=model,
+                    output_format=output_format
+                )
                 
-        except Exception as e:
-            logger.warning(f"PCM format failed, trying MP3: {e}")
-            
-            # Fallback to MP3 format
-            audio_generator = client.text_to_speech.convert(
-                text=text,
-                voice_id=voice_id,
-                model_id=model,
-                output_format="mp3_22050_32"
-            )
-            
-            # Collect all audio data
-            audio_data = b''
-            for chunk in audio_generator:
-                audio_data += chunk
-            
-            logger.info(f"Received {len(audio_data)} bytes of MP3 audio data from ElevenLabs")
+                for chunk in to_frames(audio_generator):
+                    frames_sent += 1
+                    frames.append(chunk)
+                    inflight.append(chunk)
+                
+                if frames_sent == 0:
+                    raise Exception("No audio data received from ElevenLabs")
+                
+            except Exception as e:
+                if frames_sent:
+                    # Part of the reply is already playing; restarting in
+                    # another format would repeat it
+                    logger.error(f"Voice stream interrupted after {frames_sent} chunks: {e}")
+                    return False
+                
+                logger.warning(f"{output_format} voice failed: {e}")
+                continue
             
-            # Convert to proper format for Twilio
-            converted_chunks = list(convert_audio_for_twilio(audio_data))
-            logger.info(f"Converted to {len(converted_chunks)} µ-law chunks for Twilio")
+            logger.info("Streamed %d µ-law chunks to Twilio (%s)", frames_sent, output_format)
             
-            # Return as generator
-            for chunk in converted_chunks:
-                yield chunk
+            if cache or inflight.keep:
+                _store_frames(cache_key, frames, pinned=cache)
+                _save_disk_frames(cache_key, frames)
+            return True
+        
+        raise Exception("No ElevenLabs output format succeeded")
         
     except Exception as e:
         logger.error(f"Error generating voice: {str(e)}")
-        
-        # Create fallback silence
-        logger.info("Generating fallback silence due to error")
-        silence_duration_samples = 8000  # 1 second at 8kHz
-        mulaw_silence = bytes([0xFF] * silence_duration_samples)
-        
-        # Split silence into chunks
-        chunk_size = 160
-        for i in range(0, len(mulaw_silence), chunk_size):
-            chunk = mulaw_silence[i:i + chunk_size]
-            if len(chunk) > 0:
-                yield chunk
+        return False
 
-def convert_pcm_for_twilio(pcm_data, sample_rate):
+def stream_ulaw_frames(ulaw_chunks):
     """
-    Convert PCM audio data to Twilio-compatible format (8kHz, µ-law)
+    Split a stream of 8kHz µ-law chunks of any size into Twilio frames
     
     Args:
-        pcm_data (bytes): Raw PCM audio data from ElevenLabs
-        sample_rate (int): Original sample rate of the PCM data
+        ulaw_chunks (iterable): µ-law chunks as they arrive
     
     Returns:
-        generator: Audio chunks in µ-law format for Twilio
+        generator: 160-byte (20ms) µ-law chunks; the last one may be shorter
     """
-    logger = logging.getLogger(__name__)
+    chunk_size = 160  # 20ms at 8kHz µ-law
+    pending = bytearray()
     
-    try:
-        # Create AudioSegment from raw PCM data
-        # ElevenLabs PCM is typically 16-bit, mono
-        audio = AudioSegment(
-            data=pcm_data,
-            sample_width=2,  # 16-bit = 2 bytes per sample
-            frame_rate=sample_rate,
-            channels=1  # mono
-        )
-        
-        # Convert to 8kHz sample rate for Twilio
-        audio = audio.set_frame_rate(8000)
-        
-        # Get raw PCM data at 8kHz
-        pcm_8k = audio.raw_data
-        
-        # Convert PCM to µ-law (what Twilio expects)
-        mulaw_data = audioop.lin2ulaw(pcm_8k, 2)  # 2 = 16-bit samples
-        
-        # Split into chunks for streaming
-        chunk_size = 160  # 20ms at 8kHz µ-law
-        
-        for i in range(0, len(mulaw_data), chunk_size):
-            chunk = mulaw_data[i:i + chunk_size]
-            if len(chunk) > 0:
-                yield chunk
-                
-    except Exception as e:
-        logger.error(f"Error converting PCM for Twilio: {str(e)}")
+    for chunk in ulaw_chunks:
+        pending += chunk
         
-        # Create fallback silence
-        silence_duration_samples = 8000  # 1 second at 8kHz
-        mulaw_silence = bytes([0xFF] * silence_duration_samples)
-        
-        chunk_size = 160
-        for i in range(0, len(mulaw_silence), chunk_size):
-            chunk = mulaw_silence[i:i + chunk_size]
-            if len(chunk) > 0:
-                yield chunk
+        whole = len(pending) - (len(pending) % chunk_size)
+        for i in range(0, whole, chunk_size):
+            yield bytes(pending[i:i + chunk_size])
+        del pending[:whole]
+    
+    if pending:
+        yield bytes(pending)
 
 def convert_audio_for_twilio(audio_data):
     """
@@ -176,24 +336,19 @@ def convert_audio_for_twilio(audio_data):
     Returns:
         generator: Audio chunks in µ-law format for Twilio
     """
-    logger = logging.getLogger(__name__)
-    
     try:
-        # Load the MP3 audio using pydub
-        audio = AudioSegment.from_mp3(io.BytesIO(audio_data))
-        
-        # Convert to the format Twilio expects:
-        # - Mono (1 channel)
-        # - 8kHz sample rate
-        # - 16-bit PCM first, then convert to µ-law
-        audio = audio.set_channels(1)  # Convert to mono
-        audio = audio.set_frame_rate(8000)  # Convert to 8kHz
-        audio = audio.set_sample_width(2)  # 16-bit (2 bytes per sample)
-        
-        # Get raw PCM data
-        pcm_data = audio.raw_data
+        # One ffmpeg pass decodes the MP3 straight to the format Twilio
+        # expects before µ-law: mono, 8kHz, 16-bit PCM (no ffprobe pass and
+        # no separate resample in Python)
+        result = subprocess.run(
+            ['ffmpeg', '-loglevel', 'error', '-i', 'pipe:0',
+             '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', '8000', 'pipe:1'],
+            input=audio_data, capture_output=True, check=True
+        )
+        pcm_data = result.stdout
         
         # Convert PCM to µ-law (what Twilio expects)
+        import audioop
         mulaw_data = audioop.lin2ulaw(pcm_data, 2)  # 2 = 16-bit samples
         
         # Split into chunks for streaming
@@ -208,17 +363,19 @@ def convert_audio_for_twilio(audio_data):
     except Exception as e:
         logger.error(f"Error converting audio for Twilio: {str(e)}")
         
-        # Create a simple fallback: 1 second of silence in µ-law format
-        # µ-law silence is represented by 0xFF (255 in decimal)
-        silence_duration_samples = 8000  # 1 second at 8kHz
-        mulaw_silence = bytes([0xFF] * silence_duration_samples)
-        
-        # Split silence into chunks
-        chunk_size = 160
-        for i in range(0, len(mulaw_silence), chunk_size):
-            chunk = mulaw_silence[i:i + chunk_size]
-            if len(chunk) > 0:
-                yield chunk
+        # Fallback: 1 second of silence
+        yield from _MULAW_SILENCE_FRAMES
+
+def _mp3_frames(mp3_chunks):
+    """Twilio frames for an MP3 stream; ffmpeg needs the whole file to decode"""
+    return convert_audio_for_twilio(b''.join(mp3_chunks))
+
+# ElevenLabs output formats tried in order, with the function that turns each
+# into Twilio frames: 8kHz µ-law needs no conversion, MP3 is the fallback
+_TTS_FORMATS = (
+    ("ulaw_8000", stream_ulaw_frames),
+    ("mp3_22050_32", _mp3_frames),
+)
 
 def cleanup_temp_file(file_path):
     """
@@ -233,6 +390,12 @@ def cleanup_temp_file(file_path):
     except Exception:
         pass  # Ignore cleanup errors
 
+# Default messages of process_voice_request, by voice gender
+WELCOME_MESSAGES = {
+    'male': "أهلاً وسهلاً فيك، نورت المكان. كيفك وشو أخبارك؟ أنا هون لمساعدتك بأي شي تحتاجه.",
+    'female': "أهلاً حبيبي، أهلاً وسهلاً فيك. كيف الحال وشو الأخبار؟ أنا هون عشان ساعدك بكل شي تريده."
+}
+
 def process_voice_request(gender='female', message=None):
     """
     Service to generate Arabic Syrian voice message using ElevenLabs
@@ -245,18 +408,15 @@ def process_voice_request(gender='female', message=None):
         tuple: (audio_file_path, status_code, headers)
     """
     try:
-        # Default welcoming message in Arabic Syrian
+        # Default welcoming message in Arabic Syrian; these are fixed, so
+        # they are synthesized once and replayed from the TTS cache
         if message is None:
-            welcome_messages = {
-                'male': "أهلاً وسهلاً فيك، نورت المكان. كيفك وشو أخبارك؟ أنا هون لمساعدتك بأي شي تحتاجه.",
-                'female': "أهلاً حبيبي، أهلاً وسهلاً فيك. كيف الحال وشو الأخبار؟ أنا هون عشان ساعدك بكل شي تريده."
-            }
-            text_to_speak = welcome_messages.get(gender, welcome_messages['female'])
+            text_to_speak = WELCOME_MESSAGES.get(gender, WELCOME_MESSAGES['female'])
         else:
             text_to_speak = message
         
         # Generate audio using ElevenLabs
-        audio_generator = generate_arabic_voice(text_to_speak, gender)
+        audio_generator = generate_arabic_voice(text_to_speak, gender, cache=message is None)
         
         # Create temporary file to store audio
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
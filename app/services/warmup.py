@@ -0,0 +1,54 @@
+import logging
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+def warmup_services(phrases: Iterable[str] = ()):
+    """
+    Open backend connections before the first call arrives
+    
+    Each step is independent and only logs on failure, so a missing key
+    or an unreachable backend never blocks startup.
+    
+    Args:
+        phrases (Iterable[str]): Fixed phrases (welcome, goodbye) to synthesize
+            into the TTS cache, which also opens the ElevenLabs connection
+    """
+    from app.services.conversation_service import conversation_service
+    from app.services.speech_service import speech_service
+    from app.services.voice_service import client as elevenlabs_client, generate_arabic_voice, is_voice_cached
+    
+    # Google Speech: credentials are loaded when the shared client is created
+    if speech_service.google_speech:
+        try:
+            speech_service.google_speech.client
+        except Exception as e:
+            logger.warning(f"Google Speech warmup failed: {str(e)}")
+    
+    # Gemini: a token count opens the gRPC channel without generating anything
+    if conversation_service.model:
+        try:
+            conversation_service.model.count_tokens("ping")
+            logger.info("Gemini connection warmed up")
+        except Exception as e:
+            logger.warning(f"Gemini warmup failed: {str(e)}")
+    
+    # ElevenLabs: first callers hear the cached welcome instead of waiting on TTS
+    if elevenlabs_client:
+        cached = 0
+        for phrase in phrases:
+            try:
+                for _ in generate_arabic_voice(phrase, gender='female', cache=True):
+                    pass
+            except Exception as e:
+                logger.warning(f"Voice warmup failed: {str(e)}")
+                break
+            
+            # A failed synthesis plays silence and is not cached
+            if is_voice_cached(phrase, gender='female'):
+                cached += 1
+            else:
+                logger.warning("Voice warmup got no audio for: '%.50s...'", phrase)
+        
+        if cached:
+            logger.info(f"Cached speech for {cached} fixed phrases")
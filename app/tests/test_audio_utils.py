@@ -0,0 +1,90 @@
+"""
+Tests for the inbound audio ring and µ-law helpers
+"""
+
+import struct
+
+import pytest
+
+from app.services import audio_utils
+from app.services.audio_utils import AudioRing, ulaw_to_pcm16, is_silence
+
+def test_ring_capacity_must_be_power_of_two():
+    with pytest.raises(ValueError):
+        AudioRing(1000)
+
+def test_ring_wraps_around():
+    ring = AudioRing(16)
+    ring.write(b'a' * 12)
+    assert ring.read_all() == b'a' * 12
+    
+    # Starts at offset 12, so the write wraps past the end of the buffer
+    assert ring.write(b'0123456789') == 10
+    assert ring.read_all() == b'0123456789'
+    assert len(ring) == 0
+
+def test_ring_drops_newest_bytes_when_full():
+    ring = AudioRing(16)
+    ring.write(b'a' * 10)
+    
+    assert ring.write(b'b' * 10) == 16
+    assert ring.dropped == 4
+    assert ring.write(b'c') == 16
+    assert ring.dropped == 5
+    
+    assert ring.read_all() == b'a' * 10 + b'b' * 6
+    assert ring.dropped == 0
+
+def test_ring_read_all_after_reset():
+    ring = AudioRing(16)
+    ring.write(b'x' * 20)
+    ring.reset()
+    
+    assert ring.read_all() == b''
+    assert ring.dropped == 0
+    ring.write(b'new')
+    assert ring.read_all() == b'new'
+
+# G.711 µ-law codes and their 16-bit linear values
+ULAW_KNOWN_VALUES = {
+    0x00: -32124,
+    0x0F: -16764,
+    0x7E: -8,
+    0x7F: 0,
+    0x80: 32124,
+    0x8F: 16764,
+    0xFE: 8,
+    0xFF: 0,
+}
+
+@pytest.mark.parametrize('use_audioop', [True, False])
+def test_ulaw_to_pcm16_known_values(monkeypatch, use_audioop):
+    if not use_audioop:
+        monkeypatch.setattr(audio_utils, 'audioop', None)
+    elif audio_utils.audioop is None:
+        pytest.skip("audioop is not available")
+    
+    codes = bytes(ULAW_KNOWN_VALUES)
+    pcm = ulaw_to_pcm16(codes)
+    
+    assert list(struct.unpack(f'<{len(codes)}h', pcm)) == list(ULAW_KNOWN_VALUES.values())
+
+def test_ulaw_table_matches_audioop(monkeypatch):
+    if audio_utils.audioop is None:
+        pytest.skip("audioop is not available")
+    
+    codes = bytes(range(256))
+    expected = audio_utils.audioop.ulaw2lin(codes, 2)
+    monkeypatch.setattr(audio_utils, 'audioop', None)
+    
+    assert ulaw_to_pcm16(codes) == expected
+
+def test_is_silence():
+    assert is_silence(b'')
+    assert is_silence(b'\xff' * 8000)
+    assert is_silence(b'\x7f\xf8\x77' * 1000)
+    assert not is_silence(b'\x00' * 8000)
+    
+    # 1% loud samples stays under the default 2% threshold, 5% does not
+    assert is_silence(b'\x80' * 80 + b'\xff' * 7920)
+    assert not is_silence(b'\x80' * 400 + b'\xff' * 7600)
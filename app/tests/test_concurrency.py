@@ -0,0 +1,95 @@
+"""
+Tests for the bounded worker pool and the live call registry
+"""
+
+import threading
+import time
+
+from app.call_registry import CallState, ConversationRegistry
+from app.services.event_loop import BoundedExecutor
+
+def test_try_submit_refuses_work_when_saturated():
+    executor = BoundedExecutor(max_workers=1, max_pending=2, thread_name_prefix='test')
+    release = threading.Event()
+    try:
+        running = executor.try_submit(release.wait)
+        queued = executor.try_submit(release.wait)
+        
+        assert running is not None and queued is not None
+        assert not executor.try_submit(release.wait)
+        
+        # Finished jobs give their slot back, from a done callback that may
+        # run just after result() returns
+        release.set()
+        running.result(timeout=5)
+        queued.result(timeout=5)
+        deadline = time.monotonic() + 5
+        future = executor.try_submit(lambda: 'ok')
+        while future is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+            future = executor.try_submit(lambda: 'ok')
+        assert future.result(timeout=5) == 'ok'
+    finally:
+        release.set()
+        executor.shutdown(wait=True)
+
+def test_registry_add_and_remove():
+    registry = ConversationRegistry()
+    state = CallState(call_sid='CA1', phone_number='+100')
+    
+    registry.add(state)
+    
+    assert 'CA1' in registry
+    assert len(registry) == 1
+    assert registry.get('CA1') is state
+    assert registry.remove('CA1') is state
+    assert registry.get('CA1') is None
+    assert registry.remove('CA1') is None
+    assert len(registry) == 0
+
+def test_registry_maps_streams_to_calls():
+    registry = ConversationRegistry()
+    state = CallState(call_sid='CA1', phone_number='+100')
+    registry.add(state)
+    
+    assert registry.attach_stream('CA1', 'MZ1', websocket='ws') is state
+    assert state.connected and state.websocket == 'ws'
+    assert registry.get_by_stream('MZ1') is state
+    
+    assert registry.remove_by_stream('MZ1') is state
+    assert registry.get_by_stream('MZ1') is None
+    assert 'CA1' not in registry
+
+def test_registry_attach_stream_for_unknown_call():
+    registry = ConversationRegistry()
+    
+    assert registry.attach_stream('CA404', 'MZ1', websocket=None) is None
+    assert registry.get_by_stream('MZ1') is None
+
+def test_registry_replacing_a_call_drops_its_old_stream():
+    registry = ConversationRegistry()
+    registry.add(CallState(call_sid='CA1', phone_number='+100'))
+    registry.attach_stream('CA1', 'MZ1', websocket=None)
+    
+    replacement = CallState(call_sid='CA1', phone_number='+100')
+    registry.add(replacement)
+    
+    assert registry.get('CA1') is replacement
+    assert registry.get_by_stream('MZ1') is None
+
+def test_registry_remove_drops_the_stream():
+    registry = ConversationRegistry()
+    registry.add(CallState(call_sid='CA1', phone_number='+100'))
+    registry.attach_stream('CA1', 'MZ1', websocket=None)
+    
+    registry.remove('CA1')
+    
+    assert registry.get_by_stream('MZ1') is None
+    assert registry.remove_by_stream('MZ1') is None
+
+def test_registry_counts_streaming_sessions():
+    registry = ConversationRegistry()
+    registry.add(CallState(call_sid='CA1', phone_number='+100', streaming_session=object()))
+    registry.add(CallState(call_sid='CA2', phone_number='+200'))
+    
+    assert registry.streaming_session_count() == 1
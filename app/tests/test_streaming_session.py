@@ -0,0 +1,50 @@
+"""
+Tests for StreamingSession's audio generator
+"""
+
+import time
+
+from app.services.google_speech_service import StreamingSession, STREAMING_CONFIG
+
+class FakeSpeechClient:
+    """Records the audio sent by a session; returns no results"""
+    
+    def __init__(self):
+        self.sent = []
+    
+    def streaming_recognize(self, config, requests):
+        for request in requests:
+            self.sent.append(request.audio_content)
+        return iter(())
+
+def _run_session(chunks):
+    client = FakeSpeechClient()
+    session = StreamingSession(client, STREAMING_CONFIG)
+    session.start()
+    for chunk in chunks:
+        session.add_audio_data(chunk)
+    session.stop()
+    return client.sent
+
+def test_audio_added_right_before_stop_is_sent():
+    chunks = [bytes([i]) * 320 for i in range(3)]
+    
+    sent = _run_session(chunks)
+    
+    assert b''.join(sent) == b''.join(chunks)
+
+def test_stop_without_audio_sends_nothing():
+    assert _run_session([]) == []
+
+def test_audio_is_sent_in_chunk_sized_requests():
+    client = FakeSpeechClient()
+    session = StreamingSession(client, STREAMING_CONFIG)
+    session.start()
+    chunk = b'\x01' * 320
+    for _ in range(20):
+        session.add_audio_data(chunk)
+        time.sleep(0.005)
+    session.stop()
+    
+    assert b''.join(client.sent) == chunk * 20
+    assert all(len(request) <= StreamingSession.CHUNK_BYTES + len(chunk) for request in client.sent)
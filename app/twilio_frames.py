@@ -0,0 +1,54 @@
+import msgspec
+
+# Typed views of the Twilio Media Streams messages the app reads. Fields
+# not declared here are skipped by the decoder instead of being
+# materialised into dicts.
+
+class Media(msgspec.Struct):
+    payload: str = ''
+
+class Start(msgspec.Struct):
+    callSid: str = ''
+
+class TwilioFrame(msgspec.Struct):
+    event: str = ''
+    streamSid: str = ''
+    media: Media = msgspec.field(default_factory=Media)
+    start: Start = msgspec.field(default_factory=Start)
+
+_decoder = msgspec.json.Decoder(TwilioFrame)
+
+def decode_frame(message) -> TwilioFrame:
+    """
+    Decode a Twilio media-stream WebSocket message
+    
+    Args:
+        message (str | bytes): Raw WebSocket message
+        
+    Returns:
+        TwilioFrame: Decoded frame
+        
+    Raises:
+        msgspec.DecodeError: If the message is not a valid frame
+    """
+    return _decoder.decode(message)
+
+# Fixed JSON around the payload of an outgoing media message
+_MEDIA_PREFIX = '{"event":"media","streamSid":"%s","media":{"payload":"'
+_MEDIA_SUFFIX = '"}}'
+
+def media_message_parts(stream_sid: str):
+    """
+    JSON text before and after the payload of a Twilio media message
+    
+    Only the base64 payload changes between frames of one reply, so
+    senders build these once and concatenate per frame. Twilio stream
+    SIDs are alphanumeric, so they need no JSON escaping.
+    
+    Args:
+        stream_sid (str): Twilio stream SID
+        
+    Returns:
+        tuple: (prefix, suffix) strings
+    """
+    return _MEDIA_PREFIX % stream_sid, _MEDIA_SUFFIX
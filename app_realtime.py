@@ -4,10 +4,23 @@ This version uses Google Cloud Speech-to-Text API for real-time transcription
 instead of OpenAI Whisper batch processing.
 """
 
+import logging
 import os
+from dotenv import load_dotenv
+
+# Green-thread servers must patch the standard library before anything else
+# (Flask, requests, SDK clients) imports socket/threading
+load_dotenv()
+if os.getenv('SOCKETIO_ASYNC_MODE') == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
 from app import create_app
 from app.config import config
 
+# Configure logging once for the whole process
+logging.basicConfig(level=logging.INFO)
+
 def main():
     """Main application entry point with real-time Google Speech support"""
     
@@ -36,14 +49,7 @@ def main():
     config_name = os.getenv('FLASK_ENV', 'default')
     
     # Create the Flask app
-    if use_realtime:
-        # Import the real-time version
-        from app.__init___realtime import create_app
-        app, socketio = create_app(config_name, use_realtime=True)
-    else:
-        # Import the legacy version
-        from app import create_app
-        app, socketio = create_app(config_name)
+    app, socketio = create_app(config_name, use_realtime=use_realtime)
     
     # Get configuration object
     app_config = config[config_name]
@@ -0,0 +1,22 @@
+import os
+
+# gunicorn configuration for production serving
+#
+# One gevent worker multiplexes many Twilio media-stream WebSockets and
+# webhooks on green threads. Call state (active conversations, streaming
+# sessions) lives in process memory and a call's /voice webhook and /ws
+# stream must reach the same process, so keep a single worker per
+# instance and scale out behind a sticky load balancer.
+
+wsgi_app = 'wsgi:app'
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '5000')}"
+
+worker_class = 'gevent'
+raw_env = ['SOCKETIO_ASYNC_MODE=gevent']
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Media streams stay open for the whole call
+timeout = 0
+graceful_timeout = 30
+keepalive = 5
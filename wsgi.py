@@ -0,0 +1,35 @@
+"""
+Production WSGI entry point
+
+Run with gunicorn and the gevent worker (see gunicorn.conf.py):
+
+    gunicorn -c gunicorn.conf.py
+
+The route set follows USE_GOOGLE_SPEECH, as in create_app.
+"""
+
+import logging
+import os
+from dotenv import load_dotenv
+
+# Green-thread servers must patch the standard library before anything else
+# (Flask, requests, SDK clients) imports socket/threading
+load_dotenv()
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent')
+if os.environ['SOCKETIO_ASYNC_MODE'] == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+    
+    # gRPC (Google Speech, Gemini) needs its own hook to cooperate with gevent
+    import grpc.experimental.gevent as grpc_gevent
+    grpc_gevent.init_gevent()
+elif os.environ['SOCKETIO_ASYNC_MODE'] == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
+from app import create_app
+
+# Configure logging once for the whole process
+logging.basicConfig(level=logging.INFO)
+
+app, socketio = create_app()